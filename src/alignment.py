@@ -0,0 +1,164 @@
+"""
+Model vs. human alignment metrics for all stored runs at once.
+
+The per-question means of every run (rows of a response tensor) are compared with the student and
+non-student means in CES_modified_2005.csv, over all questions and per category:
+
+    RMSE, MAE            distance between the run's and the group's question means
+    Pearson, Spearman    correlation across the questions (does the run order the behaviors like humans?)
+    sign agreement       share of questions both judge on the same side of the scale midpoint
+
+plus a run x run RMSE matrix. Everything is an array operation over (runs x questions), so hundreds of runs
+take one pass.
+
+Usage (from the repository root):
+    python src/alignment.py [name] [--tensor NAME] [--rank-by Students]
+
+Uses a saved response tensor (see response_tensor.py) or builds one from all stored runs and writes
+resources/data/alignment/<name>_{ranking,categories,questions,distances}.csv.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire
+from response_tensor import build_tensor, load_runs, load_tensor
+
+ALIGNMENT_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "alignment")
+HUMAN_SURVEY_PATH = os.path.join(DATA_FOLDER_PATH, "CES_modified_2005.csv")
+HUMAN_GROUPS = {"Students": "students", "Non-Students": "non-students"}
+MIDPOINT = 3    # 1 = wrong ... 5 = not wrong
+METRICS = ["rmse", "mae", "pearson", "spearman", "sign_agreement"]
+
+
+def load_human_means(question_ids, path: str = HUMAN_SURVEY_PATH) -> np.ndarray:
+    """(groups x questions) human means aligned to `question_ids`, NaN where the survey has no value."""
+    human = pd.read_csv(path).set_index("#")
+    return np.stack([human[column].reindex(question_ids).to_numpy(dtype=float) for column in HUMAN_GROUPS.values()])
+
+
+def _nan_corr(x: np.ndarray, y: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    # Pearson correlation along the last axis over the entries in mask
+    n = mask.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mx = np.where(mask, x, 0).sum(axis=-1) / n
+        my = np.where(mask, y, 0).sum(axis=-1) / n
+        dx = np.where(mask, x - mx[..., None], 0)
+        dy = np.where(mask, y - my[..., None], 0)
+        r = (dx * dy).sum(axis=-1) / np.sqrt((dx ** 2).sum(axis=-1) * (dy ** 2).sum(axis=-1))
+    return np.where(n >= 3, r, np.nan)
+
+
+def _ranks(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    # ranks along the last axis among the entries in mask (ties get their average rank)
+    return rankdata(np.where(mask, values, np.nan), axis=-1, nan_policy="omit")
+
+
+def alignment_metrics(means: np.ndarray, human: np.ndarray, membership: np.ndarray) -> dict:
+    """
+    Distance and correlation of every run to every human group, within every question set.
+
+    Parameters:
+    means (np.ndarray): (runs x questions) question means of the runs, NaN without valid answers
+    human (np.ndarray): (groups x questions) human question means
+    membership (np.ndarray): (sets x questions) boolean masks, e.g. all questions and the categories
+
+    Returns:
+    dict: metric name -> (runs x groups x sets) array, plus "n" (questions used)
+    """
+    # (runs x groups x sets x questions)
+    model = means[:, None, None, :]
+    ref = human[None, :, None, :]
+    mask = ~np.isnan(model) & ~np.isnan(ref) & membership[None, None, :, :]
+    model, ref = np.broadcast_arrays(model, ref)
+    n = mask.sum(axis=-1)
+
+    diff = np.where(mask, model - ref, 0)
+    same_side = np.sign(model - MIDPOINT) == np.sign(ref - MIDPOINT)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = {
+            "n": n,
+            "rmse": np.sqrt((diff ** 2).sum(axis=-1) / n),
+            "mae": np.abs(diff).sum(axis=-1) / n,
+            "pearson": _nan_corr(model, ref, mask),
+            "spearman": _nan_corr(_ranks(model, mask), _ranks(ref, mask), mask),
+            "sign_agreement": (same_side & mask).sum(axis=-1) / n,
+        }
+    return result
+
+
+def distance_matrix(means: np.ndarray) -> np.ndarray:
+    """(runs x runs) RMSE between the question means of every pair of runs."""
+    diff = means[:, None, :] - means[None, :, :]
+    with np.errstate(invalid="ignore"):
+        return np.sqrt(np.nanmean(diff ** 2, axis=-1))
+
+
+def to_tables(metrics: dict, runs: list, scopes: list) -> pd.DataFrame:
+    """Long table (run, group, scope) of the metrics."""
+    r, g, s = np.meshgrid(np.arange(len(runs)), np.arange(len(HUMAN_GROUPS)), np.arange(len(scopes)), indexing="ij")
+    table = pd.DataFrame({
+        "run": np.asarray(runs)[r.ravel()],
+        "group": np.asarray(list(HUMAN_GROUPS))[g.ravel()],
+        "scope": np.asarray(scopes)[s.ravel()],
+        "questions": metrics["n"].ravel(),
+    })
+    for metric in METRICS:
+        table[metric] = metrics[metric].ravel()
+    return table
+
+
+def ranking(table: pd.DataFrame, rank_by: str = "Students") -> pd.DataFrame:
+    """One row per run with the metrics over all questions for both groups, ranked by RMSE to `rank_by`."""
+    wide = table[table["scope"] == "all"].pivot(index="run", columns="group", values=METRICS)
+    wide.columns = [f"{metric}_{group}" for metric, group in wide.columns]
+    wide = wide.sort_values(f"rmse_{rank_by}")
+    wide.insert(0, "rank", np.arange(1, len(wide) + 1))
+    return wide
+
+
+def run_alignment(tensor, index, human_path: str = HUMAN_SURVEY_PATH) -> tuple:
+    """Metrics table (all questions and per category), per-question errors and run distances of a tensor."""
+    means = tensor.means()
+    human = load_human_means(tensor.question_ids, human_path)
+    membership = index.membership[:, np.searchsorted(index.ids, tensor.question_ids)]
+    scopes = ["all", *index.labels]
+    membership = np.vstack([np.ones((1, membership.shape[1]), dtype=bool), membership.astype(bool)])
+
+    table = to_tables(alignment_metrics(means, human, membership), tensor.models, scopes)
+
+    errors = pd.DataFrame(
+        (means[:, None, :] - human[None, :, :]).reshape(len(tensor.models) * len(HUMAN_GROUPS), -1),
+        index=pd.MultiIndex.from_product([tensor.models, list(HUMAN_GROUPS)], names=["run", "group"]),
+        columns=pd.Index(tensor.question_ids, name="#"),
+    )
+    distances = pd.DataFrame(distance_matrix(means), index=tensor.models, columns=tensor.models)
+    return table, errors, distances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alignment of all stored runs with the human CES means.")
+    parser.add_argument("name", nargs="?", default="all", help="name of the output files")
+    parser.add_argument("--tensor", default=None, help="saved response tensor (default: build from all runs)")
+    parser.add_argument("--rank-by", default="Students", choices=list(HUMAN_GROUPS))
+    args = parser.parse_args()
+
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    tensor = load_tensor(args.tensor) if args.tensor else build_tensor(load_runs(None, index), index)
+    table, errors, distances = run_alignment(tensor, index)
+    ranked = ranking(table, args.rank_by)
+
+    os.makedirs(ALIGNMENT_FOLDER_PATH, exist_ok=True)
+    stem = os.path.join(ALIGNMENT_FOLDER_PATH, args.name)
+    ranked.to_csv(f"{stem}_ranking.csv")
+    table.to_csv(f"{stem}_categories.csv", index=False)
+    errors.to_csv(f"{stem}_questions.csv")
+    distances.to_csv(f"{stem}_distances.csv")
+
+    print(f"Alignment of {len(tensor.models)} runs (ranked by RMSE to {args.rank_by}):")
+    print(ranked.round(3).to_string())
+    print(f"\nTables written to {stem}_*.csv")
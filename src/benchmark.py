@@ -0,0 +1,318 @@
+"""
+Benchmark suite for the offline part of the pipeline (questions -> processing -> plots -> report -> stats).
+
+Synthetic raw-response datasets are generated at several scales and every stage is timed
+on them. Results can be saved as a baseline file and later runs compared against it.
+
+Usage (from the repository root):
+    python src/benchmark.py                                 # run and print timings
+    python src/benchmark.py --save                          # store as resources/data/benchmarks/baseline.json
+    python src/benchmark.py --compare baseline.json         # flag regressions against a baseline
+    python src/benchmark.py --iterations 100 1000 --models 1 5 --repeat 3
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+
+matplotlib.use("Agg")  # no windows while benchmarking
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from config.configuration import (
+    PATH_TO_QUESTIONS,
+    DATA_FOLDER_PATH,
+    BENCHMARK_FOLDER_PATH,
+)
+
+NUM_QUESTIONS = 31
+DEFAULT_ITERATIONS = [100, 1000, 10000]
+DEFAULT_MODELS = [1, 5, 20, 50]
+DEFAULT_THRESHOLD = 0.2  # 20% slower than the baseline counts as a regression
+BASELINE_FILE = "baseline.json"
+
+
+def load_stats_module():
+    # ces-stats-eval.py is not importable by name because of the hyphens
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ces-stats-eval.py")
+    spec = importlib.util.spec_from_file_location("ces_stats_eval", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_synthetic_raw(questions: list[str], num_itr: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Create a raw-response DataFrame in the same layout main.get_data writes (#, Question, Iteration, Response).
+    Each question gets its own skewed score distribution so the data looks roughly like real runs.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(questions)
+    probs = rng.dirichlet(np.full(5, 0.6), size=n)
+    responses = np.empty((n, num_itr), dtype=np.int64)
+    for q in range(n):
+        responses[q] = rng.choice(np.arange(1, 6), size=num_itr, p=probs[q])
+
+    return pd.DataFrame({
+        "#": np.repeat(np.arange(1, n + 1), num_itr),
+        "Question": np.repeat(np.asarray(questions, dtype=object), num_itr),
+        "Iteration": np.tile(np.arange(num_itr), n),
+        "Response": responses.ravel(),
+    })
+
+
+def to_data_list(df: pd.DataFrame) -> list:
+    # evaluate_CES returns rows as lists with the response still as text
+    return [[i, q, j, str(r)] for i, q, j, r in df.itertuples(index=False, name=None)]
+
+
+def setup_workspace(root: str, questions_path: str):
+    """Mirror the folder layout the pipeline expects (relative to cwd) inside a scratch directory."""
+    for sub in ("raw_data", "averages", "plots", "reports"):
+        os.makedirs(os.path.join(root, DATA_FOLDER_PATH, sub), exist_ok=True)
+    os.makedirs(os.path.join(root, "src", "config"), exist_ok=True)
+    with open(os.path.join(root, "src", "config", "state.json"), "w") as f:
+        json.dump({}, f)
+    shutil.copy(os.path.join(DATA_FOLDER_PATH, "CES_modified_2005.csv"), os.path.join(root, DATA_FOLDER_PATH))
+    os.makedirs(os.path.join(root, os.path.dirname(PATH_TO_QUESTIONS)), exist_ok=True)
+    shutil.copy(questions_path, os.path.join(root, PATH_TO_QUESTIONS))
+
+
+def time_call(fn, repeat: int, teardown=None) -> tuple:
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown(result)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "repeat": repeat,
+    }, result
+
+
+def close_figures(_=None):
+    plt.close("all")
+
+
+def bench_pipeline(num_itr: int, repeat: int, results: dict, log=print):
+    """Time the per-run stages of main.py on one synthetic run with `num_itr` iterations per question."""
+    import main
+    from plotting_helper import make_graphs, make_heatmap
+    from questionnaire import load_questionnaire
+    from report_helper import create_pdf_report
+
+    regex = r"^\d+\.\s+(.+)$"
+    questions = main.get_questions(PATH_TO_QUESTIONS, regex)
+    tag = f"itr={num_itr}"
+
+    stats, _ = time_call(lambda: main.get_questions(PATH_TO_QUESTIONS, regex), repeat)
+    results[f"get_questions[{tag}]"] = stats
+
+    # cached index (hash check + memo lookup) after a first cold parse
+    load_questionnaire(PATH_TO_QUESTIONS)
+    stats, _ = time_call(lambda: load_questionnaire(PATH_TO_QUESTIONS), repeat)
+    results[f"load_questionnaire[{tag}]"] = stats
+
+    raw = make_synthetic_raw(questions, num_itr)
+    data_list = to_data_list(raw)
+    main.PREFIX = "BENCH"
+
+    stats, (avgs, images) = time_call(lambda: main.get_data(data_list), repeat, teardown=close_figures)
+    results[f"get_data[{tag}]"] = stats
+    log(f"\tget_data[{tag}]: {stats['median']:.3f}s")
+
+    # inputs for the plotting helpers, built the same way get_data does
+    ref = pd.read_csv(f"{DATA_FOLDER_PATH}/CES_modified_2005.csv")
+    graphs = pd.merge(avgs, ref, on="#", how="inner")
+    graphs = graphs.drop(graphs.columns[0], axis=1)
+    graphs.index += 1
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    slices = index.positions()
+    labels = index.labels
+    errors = pd.DataFrame(0, index=graphs.index, columns=graphs.columns)
+    errors["Average"] = raw.groupby("#")["Response"].std()
+
+    stats, _ = time_call(lambda: make_graphs(graphs, slices, labels, errors, "BENCH"), repeat, teardown=close_figures)
+    results[f"make_graphs[{tag}]"] = stats
+
+    stats, _ = time_call(lambda: make_heatmap(raw, "BENCH"), repeat, teardown=close_figures)
+    results[f"make_heatmap[{tag}]"] = stats
+    log(f"\tmake_heatmap[{tag}]: {stats['median']:.3f}s")
+
+    def report():
+        images = make_graphs(graphs, slices, labels, errors, "BENCH")
+        images.append(make_heatmap(raw, "BENCH"))
+        start = time.perf_counter()
+        create_pdf_report("bench", "synthetic", "BENCH", avgs, images, open_report=False)
+        return time.perf_counter() - start
+
+    # only the report itself is timed, not the figure creation it needs as input
+    times = []
+    for _ in range(repeat):
+        times.append(report())
+        close_figures()
+    results[f"create_pdf_report[{tag}]"] = {"median": statistics.median(times), "min": min(times), "repeat": repeat}
+    log(f"\tcreate_pdf_report[{tag}]: {results[f'create_pdf_report[{tag}]']['median']:.3f}s")
+
+
+def bench_stats(num_itr: int, num_models: int, repeat: int, results: dict, log=print):
+    """Time the ces-stats-eval.py functions on `num_models` synthetic runs."""
+    ces_stats = load_stats_module()
+    import main
+
+    questions = main.get_questions(PATH_TO_QUESTIONS, r"^\d+\.\s+(.+)$")
+    tag = f"itr={num_itr},models={num_models}"
+
+    # write the synthetic runs to disk so loading is part of the measurement
+    paths = {}
+    for m in range(num_models):
+        raw = make_synthetic_raw(questions, num_itr, seed=m)
+        raw_path = os.path.join(DATA_FOLDER_PATH, "raw_data", f"BENCH{m}_raw_data.csv")
+        avg_path = os.path.join(DATA_FOLDER_PATH, "averages", f"BENCH{m}_averages.csv")
+        raw.to_csv(raw_path, index=False)
+        avgs = raw.groupby("#")["Response"].agg(Average="mean", std="std")
+        avgs.to_csv(avg_path)
+        paths[f"model_{m}"] = {"raw": raw_path, "avg": avg_path}
+    survey_path = os.path.join(DATA_FOLDER_PATH, "CES_modified_2005.csv")
+
+    stats, ai_data = time_call(lambda: ces_stats.load_ai_data(paths), repeat)
+    results[f"load_ai_data[{tag}]"] = stats
+
+    stats, human = time_call(lambda: ces_stats.load_human_data(survey_path), repeat)
+    results[f"load_human_data[{tag}]"] = stats
+
+    categories = ces_stats.get_category_questions()
+    stats, processed = time_call(lambda: ces_stats.process_data_for_analysis(human, ai_data, categories), repeat)
+    results[f"process_data_for_analysis[{tag}]"] = stats
+    log(f"\tprocess_data_for_analysis[{tag}]: {stats['median']:.3f}s")
+
+    stats, _ = time_call(lambda: ces_stats.analyze_all_categories(processed), repeat)
+    results[f"analyze_all_categories[{tag}]"] = stats
+    log(f"\tanalyze_all_categories[{tag}]: {stats['median']:.3f}s")
+
+    first = next(iter(categories))
+    stats, _ = time_call(lambda: ces_stats.visualize_results(processed, first), repeat, teardown=close_figures)
+    results[f"visualize_results[{tag}]"] = stats
+
+
+def run_benchmarks(iterations: list[int], models: list[int], repeat: int, stages: set, log=print) -> dict:
+    results = {}
+    questions_path = os.path.abspath(PATH_TO_QUESTIONS)
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="ces-bench-") as root:
+        setup_workspace(root, questions_path)
+        os.chdir(root)
+        try:
+            for num_itr in iterations:
+                if "pipeline" in stages:
+                    log(f"Pipeline stages, {NUM_QUESTIONS} questions x {num_itr} iterations...")
+                    bench_pipeline(num_itr, repeat, results, log)
+                if "stats" in stages:
+                    for num_models in models:
+                        log(f"Statistics, {num_models} model(s) x {num_itr} iterations...")
+                        bench_stats(num_itr, num_models, repeat, results, log)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[dict]:
+    """
+    Compare two benchmark result sets by median time.
+
+    Returns:
+    list: one entry per benchmark present in both sets, with the ratio current/baseline and a regression flag
+    """
+    rows = []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = cur["median"] / base["median"] if base["median"] > 0 else float("inf")
+        rows.append({
+            "benchmark": key,
+            "baseline": base["median"],
+            "current": cur["median"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def print_results(result: dict):
+    print(f"\n{'benchmark':<55}{'median [s]':>12}{'min [s]':>12}")
+    for key, stats in result["results"].items():
+        print(f"{key:<55}{stats['median']:>12.4f}{stats['min']:>12.4f}")
+
+
+def print_comparison(rows: list[dict], threshold: float):
+    print(f"\n{'benchmark':<55}{'baseline':>10}{'current':>10}{'ratio':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<55}{row['baseline']:>10.4f}{row['current']:>10.4f}{row['ratio']:>8.2f}{flag}")
+    n = sum(r["regression"] for r in rows)
+    print(f"\n{n} regression(s) beyond {threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the offline CES evaluation pipeline.")
+    parser.add_argument("--iterations", type=int, nargs="+", default=DEFAULT_ITERATIONS)
+    parser.add_argument("--models", type=int, nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--stages", nargs="+", choices=["pipeline", "stats"], default=["pipeline", "stats"])
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--save", action="store_true", help=f"write results to {BENCHMARK_FOLDER_PATH}/{BASELINE_FILE}")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a stored baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    result = run_benchmarks(args.iterations, args.models, args.repeat, set(args.stages))
+    print_results(result)
+
+    output = args.output
+    if args.save:
+        os.makedirs(BENCHMARK_FOLDER_PATH, exist_ok=True)
+        output = os.path.join(BENCHMARK_FOLDER_PATH, BASELINE_FILE)
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if args.compare:
+        path = args.compare
+        if not os.path.exists(path):
+            path = os.path.join(BENCHMARK_FOLDER_PATH, path)
+        with open(path, "r") as f:
+            baseline = json.load(f)
+        rows = compare(result, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        if any(r["regression"] for r in rows):
+            sys.exit(1)
@@ -5,6 +5,9 @@ from statsmodels.stats.multicomp import pairwise_tukeyhsd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from config.configuration import PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire
+
 
 def load_ai_data(model_data_paths):
     """
@@ -58,23 +61,17 @@ def load_human_data(survey_path):
     return human_data
 
 
-def get_category_questions():
+def get_category_questions(path=PATH_TO_QUESTIONS):
     """
-    Define which questions belong to which categories for the original CES.
-    Adjust these mappings according to your original CES categories.
+    Define which questions belong to which categories, as given by the `###` headings of the questionnaire.
+
+    Parameters:
+    path (str): Path to the questionnaire markdown file
 
     Returns:
     dict: Mapping of categories to question numbers
     """
-    return {
-        "Active": [1, 2, 3, 4, 5],              # Actively benefiting from illegal activities
-        "Passive": [6, 7, 8, 9, 11],            # Passively benefiting
-        "Questionable": [12, 13, 14, 15, 16],   # Actively benefiting from questionable but legal actions
-        "No_Harm": [17, 18, 19, 20, 21],        # No harm/no foul
-        "Downloading": [22, 23],                # downloading copyrighted materials/buying counterfeit goods
-        "Recycling": [24, 25, 26, 27],          # recycling/environmental awareness
-        "Doing_Good": [28, 29, 30, 31]          # doing good/doing the right thing
-    }
+    return load_questionnaire(path).groups()
 
 
 def process_data_for_analysis(human_data, ai_model_data, categories):
@@ -104,18 +101,45 @@ def process_data_for_analysis(human_data, ai_model_data, categories):
             category_data[model_name] = []
 
         # Process human data
-        for q in questions:
-            q_index = q - 1  # Adjust for 0-indexing if needed
-            if q_index < len(human_data['Students']):
-                category_data['Students'].append(human_data['Students'][q_index])
-                category_data['Non-Students'].append(human_data['Non-Students'][q_index])
+        q_index = np.asarray(questions) - 1  # Adjust for 0-indexing
+        q_index = q_index[q_index < len(human_data['Students'])]
+        category_data['Students'].extend(np.asarray(human_data['Students'])[q_index].tolist())
+        category_data['Non-Students'].extend(np.asarray(human_data['Non-Students'])[q_index].tolist())
 
-        # Process AI data
+        # Process AI data (one mask per category, rows are stored sorted by question)
         for model_name, model_dfs in ai_model_data.items():
             raw_df = model_dfs["raw"]
-            for q in questions:
-                mask = raw_df["#"] == q
-                category_data[model_name].extend(raw_df.loc[mask, "Response"].tolist())
+            mask = raw_df["#"].isin(questions)
+            category_data[model_name].extend(raw_df.loc[mask, "Response"].tolist())
+
+        processed_data[category] = category_data
+
+    return processed_data
+
+
+def process_tensor_for_analysis(human_data, tensor, categories):
+    """
+    Same as process_data_for_analysis, for runs loaded as a response tensor (see response_tensor.py).
+
+    Parameters:
+    human_data (dict): Dictionary with human data for 'Students' and 'Non-Students'
+    tensor (ResponseTensor): Responses of the AI models (models x questions x iterations)
+    categories (dict): Category to question mapping
+
+    Returns:
+    dict: Processed data organized by category
+    """
+    processed_data = {}
+
+    for category, questions in categories.items():
+        q_index = np.asarray(questions) - 1
+        q_index = q_index[q_index < len(human_data['Students'])]
+        category_data = {
+            'Students': np.asarray(human_data['Students'])[q_index].tolist(),
+            'Non-Students': np.asarray(human_data['Non-Students'])[q_index].tolist(),
+        }
+        for model_name in tensor.models:
+            category_data[model_name] = tensor.values(model_name, questions)
 
         processed_data[category] = category_data
 
@@ -0,0 +1,137 @@
+"""
+Compare the answer distributions of two stored runs, e.g. single-statement vs. packed requests (PACK_SIZE > 1).
+
+Usage (from the repository root):
+    python src/compare_runs.py <baseline prefix> <candidate prefix>
+
+Reads resources/data/raw_data/<prefix>_raw_data.csv (and usage/<prefix>_usage.json when present) for both
+runs and writes a per-question comparison to resources/data/comparisons/<baseline>_vs_<candidate>.csv.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire
+
+SCORES = [1, 2, 3, 4, 5]
+ALPHA = 0.05
+
+
+def load_run(prefix: str) -> tuple[pd.DataFrame, dict]:
+    raw = pd.read_csv(f"{DATA_FOLDER_PATH}/raw_data/{prefix}_raw_data.csv")
+    raw["Response"] = pd.to_numeric(raw["Response"], errors="coerce")
+
+    usage = None
+    usage_path = f"{DATA_FOLDER_PATH}/usage/{prefix}_usage.json"
+    if os.path.exists(usage_path):
+        with open(usage_path, "r") as f:
+            usage = json.load(f)
+    return raw, usage
+
+
+def score_counts(raw: pd.DataFrame) -> pd.DataFrame:
+    """Question x score (1-5) frequency table, invalid answers are left out."""
+    valid = raw[raw["Response"].isin(SCORES)]
+    return pd.crosstab(valid["#"], valid["Response"]).reindex(columns=SCORES, fill_value=0)
+
+
+def compare_distributions(raw_a: pd.DataFrame, raw_b: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-question comparison of two runs.
+
+    Returns:
+    pd.DataFrame: indexed by question number with the means of both runs, their difference, the total
+        variation distance between the score distributions and the p-value of a chi-square test
+    """
+    counts_a = score_counts(raw_a)
+    counts_b = score_counts(raw_b)
+    questions = counts_a.index.union(counts_b.index)
+    counts_a = counts_a.reindex(questions, fill_value=0)
+    counts_b = counts_b.reindex(questions, fill_value=0)
+
+    a = counts_a.to_numpy(dtype=float)
+    b = counts_b.to_numpy(dtype=float)
+    n_a = a.sum(axis=1)
+    n_b = b.sum(axis=1)
+    values = np.asarray(SCORES, dtype=float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_a = a / n_a[:, None]
+        p_b = b / n_b[:, None]
+        mean_a = p_a @ values
+        mean_b = p_b @ values
+    tvd = 0.5 * np.abs(p_a - p_b).sum(axis=1)
+
+    p_values = np.full(len(questions), np.nan)
+    for k in range(len(questions)):
+        table = np.vstack([a[k], b[k]])
+        table = table[:, table.sum(axis=0) > 0]
+        if n_a[k] == 0 or n_b[k] == 0:
+            continue
+        if table.shape[1] < 2:
+            p_values[k] = 1.0   # both runs gave the same single answer
+            continue
+        p_values[k] = stats.chi2_contingency(table)[1]
+
+    return pd.DataFrame({
+        "n_a": n_a.astype(int),
+        "n_b": n_b.astype(int),
+        "mean_a": mean_a,
+        "mean_b": mean_b,
+        "mean_diff": mean_b - mean_a,
+        "tvd": tvd,
+        "chi2_p": p_values,
+    }, index=pd.Index(questions, name="#"))
+
+
+def summarize(comparison: pd.DataFrame, usage_a: dict = None, usage_b: dict = None) -> dict:
+    summary = {
+        "questions": len(comparison),
+        "mean_abs_diff": float(comparison["mean_diff"].abs().mean()),
+        "max_abs_diff": float(comparison["mean_diff"].abs().max()),
+        "mean_tvd": float(comparison["tvd"].mean()),
+        "shifted_questions": int((comparison["chi2_p"] < ALPHA).sum()),
+    }
+    if usage_a and usage_b:
+        for key in ("requests", "input_tokens", "output_tokens"):
+            summary[f"{key}_a"] = usage_a[key]
+            summary[f"{key}_b"] = usage_b[key]
+        if usage_b["requests"]:
+            summary["request_ratio"] = usage_a["requests"] / usage_b["requests"]
+        summary["fallback_items_b"] = usage_b.get("fallback_items", 0)
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python compare_runs.py <baseline prefix> <candidate prefix>")
+        sys.exit(1)
+
+    prefix_a, prefix_b = sys.argv[1], sys.argv[2]
+    raw_a, usage_a = load_run(prefix_a)
+    raw_b, usage_b = load_run(prefix_b)
+
+    comparison = compare_distributions(raw_a, raw_b)
+    os.makedirs(f"{DATA_FOLDER_PATH}/comparisons", exist_ok=True)
+    out_path = f"{DATA_FOLDER_PATH}/comparisons/{prefix_a}_vs_{prefix_b}.csv"
+    comparison.to_csv(out_path)
+
+    print(f"Comparison of {prefix_a} (a) and {prefix_b} (b):")
+    print(comparison.round(3).to_string())
+
+    # mean shift per questionnaire category
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    diffs = comparison["mean_diff"].reindex(index.ids).to_numpy()
+    print("\nMean difference (b - a) per category:")
+    for lbl, value in zip(index.labels, index.category_means(diffs)):
+        print(f"\t{lbl}: {value:+.3f}")
+
+    print("\nSummary:")
+    for key, value in summarize(comparison, usage_a, usage_b).items():
+        print(f"\t{key}: {value:.3f}" if isinstance(value, float) else f"\t{key}: {value}")
+    print(f"\nComparison written to {out_path}")
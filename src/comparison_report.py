@@ -0,0 +1,312 @@
+"""
+Incremental multi-model comparison report.
+
+Every section of the report is keyed by a hash of its input data and rendering parameters and kept in
+resources/data/cache/comparison/ (statistics as JSON, figures as PNG):
+
+    model summary   <- raw data file content, questionnaire        (n, mean, variance, score counts per category)
+    model figure    <- model summary, figure parameters
+    category stats  <- summaries of all groups in the category     (ANOVA and Tukey-Kramer from the summaries)
+    category figure <- summaries of all groups in the category, figure parameters
+
+Only the raw data of new or changed runs is read again. The category sections are rebuilt from the cached
+summaries, so adding one model to the report costs one model summary and figure plus a few small
+summary-level computations.
+
+Usage (from the repository root):
+    python src/comparison_report.py [prefix ...] [--name NAME] [--no-open]
+
+Without prefixes the five models compared in ces-stats-eval.py are used, together with the human
+reference in CES_modified_2005.csv.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+from statsmodels.stats.libqsturng import psturng
+
+from config.configuration import CACHE_FOLDER_PATH, DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from plotting_helper import save_figure
+from questionnaire import load_questionnaire
+from report_helper import init_pdf
+from response_tensor import read_raw
+
+CACHE_VERSION = 1   # bump when the statistics or figures change, invalidates all cached sections
+COMPARISON_CACHE_PATH = os.path.join(CACHE_FOLDER_PATH, "comparison")
+HUMAN_SURVEY_PATH = os.path.join(DATA_FOLDER_PATH, "CES_modified_2005.csv")
+DEFAULT_PREFIXES = ["GPT-3.5-turbo", "GPT-4o", "GPT-4o-mini", "Gemini", "Grok"]
+HUMAN_GROUPS = {"Students": "students", "Non-Students": "non-students"}
+SCORES = [1, 2, 3, 4, 5]
+ALPHA = 0.05
+FIGURE_PARAMS = {"figsize": [10, 5], "dpi": 100}
+
+
+def content_hash(*parts) -> str:
+    """Hash of raw bytes and/or JSON-serializable parts (length-prefixed, so parts cannot run into each other)."""
+    h = hashlib.sha256(f"comparison-v{CACHE_VERSION}".encode())
+    for part in parts:
+        data = part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode()
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()[:32]
+
+
+class SectionCache:
+    """Content-addressed store for statistics (JSON) and figures (PNG), counting reused and computed sections."""
+
+    def __init__(self, folder: str = COMPARISON_CACHE_PATH):
+        self.folder = folder
+        self.computed = []
+        self.reused = []
+        os.makedirs(os.path.join(folder, "stats"), exist_ok=True)
+        os.makedirs(os.path.join(folder, "figures"), exist_ok=True)
+
+    def stats(self, name: str, key: str, compute: callable) -> dict:
+        path = os.path.join(self.folder, "stats", f"{key}.json")
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.reused.append(name)
+                return json.load(f)
+        result = compute()
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(result, f)
+        os.replace(f"{path}.tmp", path)
+        self.computed.append(name)
+        return result
+
+    def figure(self, name: str, key: str, render: callable) -> str:
+        path = os.path.join(self.folder, "figures", f"{key}.png")
+        if os.path.exists(path):
+            self.reused.append(name)
+            return path
+        fig = render()
+        save_figure(fig, f"{path}.tmp", FIGURE_PARAMS["dpi"])
+        plt.close(fig)
+        os.replace(f"{path}.tmp", path)
+        self.computed.append(name)
+        return path
+
+
+def summarize_values(values: np.ndarray) -> dict:
+    """Sufficient statistics of one group's answers: n, mean, variance (ddof=1) and score counts."""
+    values = values[~np.isnan(values)]
+    n = len(values)
+    return {
+        "n": n,
+        "mean": float(values.mean()) if n else None,
+        "var": float(values.var(ddof=1)) if n > 1 else None,
+        "counts": [int((values == s).sum()) for s in SCORES],
+    }
+
+
+def summarize_run(raw: pd.DataFrame, groups: dict) -> dict:
+    """Summary per category of one model's raw answers (answers that are not a score 1-5 are left out)."""
+    raw = raw[raw["Response"].isin(SCORES)]
+    return {
+        category: summarize_values(raw.loc[raw["#"].isin(questions), "Response"].to_numpy(dtype=float))
+        for category, questions in groups.items()
+    }
+
+
+def summarize_human(human: pd.DataFrame, column: str, groups: dict) -> dict:
+    """Summary per category of a human reference group (its per-question means are the samples)."""
+    by_question = human.set_index("#")[column]
+    return {
+        category: summarize_values(by_question.reindex(questions).to_numpy(dtype=float))
+        for category, questions in groups.items()
+    }
+
+
+def anova_tukey(summaries: dict, alpha: float = ALPHA) -> dict:
+    """
+    One-way ANOVA and Tukey-Kramer pairwise comparisons from group summaries only.
+
+    Parameters:
+    summaries (dict): group name -> summary (n, mean, var) of one category
+
+    Returns:
+    dict: F statistic, p-value, pooled MSE and the pairwise comparisons (p_adj clipped to [0.001, 0.9])
+    """
+    groups = {g: s for g, s in summaries.items() if s["n"] > 1}
+    k = len(groups)
+    n = np.array([s["n"] for s in groups.values()], dtype=float)
+    mean = np.array([s["mean"] for s in groups.values()])
+    var = np.array([s["var"] for s in groups.values()])
+    df_within = n.sum() - k
+    if k < 2 or df_within <= 0:
+        return {"f_statistic": None, "p_value": None, "mse": None, "pairs": []}
+
+    grand = (n * mean).sum() / n.sum()
+    ss_between = (n * (mean - grand) ** 2).sum()
+    mse = ((n - 1) * var).sum() / df_within
+    f_stat = (ss_between / (k - 1)) / mse if mse > 0 else np.inf
+    p_val = float(stats.f.sf(f_stat, k - 1, df_within)) if mse > 0 else 0.0
+
+    # studentized range p-values for all pairs at once (psturng's approximation, clipped to [0.001, 0.9],
+    # scipy's exact studentized_range.sf takes ~20 ms per pair)
+    names = list(groups)
+    a, b = np.array(list(itertools.combinations(range(k), 2))).T
+    diff = mean[b] - mean[a]
+    with np.errstate(divide="ignore"):
+        q = np.abs(diff) / np.sqrt(mse / 2 * (1 / n[a] + 1 / n[b]))
+    p_adj = np.atleast_1d(psturng(np.minimum(q, 1e3), k, df_within))
+    pairs = [
+        {"group1": names[i], "group2": names[j], "meandiff": float(d), "p_adj": float(p), "reject": bool(p < alpha)}
+        for i, j, d, p in zip(a, b, diff, p_adj)
+    ]
+
+    return {"f_statistic": float(f_stat), "p_value": p_val, "mse": float(mse), "pairs": pairs}
+
+
+def render_model_figure(name: str, summary: dict) -> plt.Figure:
+    # share of each score per category, stacked
+    categories = list(summary)
+    counts = np.array([summary[c]["counts"] for c in categories], dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = counts / counts.sum(axis=1, keepdims=True)
+    fig, ax = plt.subplots(figsize=FIGURE_PARAMS["figsize"])
+    bottom = np.zeros(len(categories))
+    colors = plt.cm.RdYlGn(np.linspace(0.1, 0.9, len(SCORES)))
+    for s, color in zip(range(len(SCORES)), colors):
+        ax.bar(categories, shares[:, s], bottom=bottom, color=color, label=str(SCORES[s]))
+        bottom += np.nan_to_num(shares[:, s])
+    ax.set_ylim(0, 1)
+    ax.set_ylabel("Share of responses")
+    ax.set_title(f"{name} Score Distribution per Category")
+    ax.legend(title="Score", bbox_to_anchor=(1.01, 1), loc="upper left")
+    fig.tight_layout()
+    return fig
+
+
+def render_category_figure(category: str, summaries: dict) -> plt.Figure:
+    # group means with standard deviation bars
+    names = list(summaries)
+    means = [summaries[g]["mean"] if summaries[g]["mean"] is not None else np.nan for g in names]
+    stds = [np.sqrt(summaries[g]["var"]) if summaries[g]["var"] is not None else 0 for g in names]
+    fig, ax = plt.subplots(figsize=FIGURE_PARAMS["figsize"])
+    colors = ["#4682b4" if g in HUMAN_GROUPS else "#2ca02c" for g in names]
+    ax.bar(names, means, yerr=stds, capsize=4, ecolor="darkred", color=colors)
+    ax.set_ylim(0, 5.9)
+    ax.set_ylabel("Avg Score")
+    ax.set_title(category)
+    ax.tick_params(axis="x", rotation=45)
+    fig.tight_layout()
+    return fig
+
+
+def build_comparison(prefixes: list, cache: SectionCache, questionnaire: str = PATH_TO_QUESTIONS,
+                     human_path: str = HUMAN_SURVEY_PATH) -> dict:
+    """
+    Build (or fetch from the cache) every section of the comparison report.
+
+    Returns:
+    dict: group summaries, per-category statistics and figure paths of the models and categories
+    """
+    index = load_questionnaire(questionnaire)
+    groups = index.groups()
+
+    summaries = {}
+    with open(human_path, "rb") as f:
+        human_bytes = f.read()
+    for group, column in HUMAN_GROUPS.items():
+        key = content_hash("human", human_bytes, column, index.sha256)
+        summaries[group] = cache.stats(
+            group, key, lambda: summarize_human(pd.read_csv(human_path), column, groups)
+        )
+
+    model_figures = {}
+    for prefix in prefixes:
+        path = os.path.join(DATA_FOLDER_PATH, "raw_data", f"{prefix}_raw_data.csv")
+        with open(path, "rb") as f:
+            key = content_hash("model", f.read(), index.sha256)
+        summaries[prefix] = cache.stats(prefix, key, lambda: summarize_run(read_raw(path), groups))
+        model_figures[prefix] = cache.figure(
+            f"{prefix} figure", content_hash("model-figure", prefix, summaries[prefix], FIGURE_PARAMS),
+            lambda: render_model_figure(prefix, summaries[prefix]),
+        )
+
+    category_stats, category_figures = {}, {}
+    for category in groups:
+        inputs = {g: summaries[g][category] for g in summaries}
+        category_stats[category] = cache.stats(
+            category, content_hash("category", category, inputs, ALPHA), lambda: anova_tukey(inputs)
+        )
+        category_figures[category] = cache.figure(
+            f"{category} figure", content_hash("category-figure", category, inputs, FIGURE_PARAMS),
+            lambda: render_category_figure(category, inputs),
+        )
+
+    return {
+        "summaries": summaries,
+        "category_stats": category_stats,
+        "category_figures": category_figures,
+        "model_figures": model_figures,
+    }
+
+
+def write_report(comparison: dict, name: str, open_report: bool = True) -> str:
+    pdf = init_pdf()
+    pdf.set_font("Times", 'B', 16)
+    pdf.cell(160, 10, f"Comparison Report ({name})", ln=True, align='C')
+    pdf.ln(5)
+    pdf.set_font("Times", size=12)
+    pdf.multi_cell(160, 5, "Groups: " + ", ".join(comparison["summaries"]))
+    pdf.ln(5)
+
+    img_width = 150
+    for category, result in comparison["category_stats"].items():
+        pdf.set_font("Times", 'B', 14)
+        pdf.cell(160, 10, category, ln=True)
+        pdf.set_font("Times", size=11)
+        if result["f_statistic"] is None:
+            pdf.cell(160, 5, "Insufficient data for ANOVA analysis", ln=True)
+        else:
+            pdf.cell(160, 5, f"ANOVA: F = {result['f_statistic']:.4f}, p = {result['p_value']:.4f}, MSE = {result['mse']:.4f}", ln=True)
+        for group, summary in comparison["summaries"].items():
+            s = summary[category]
+            if s["mean"] is not None:
+                std = np.sqrt(s["var"]) if s["var"] is not None else 0.0
+                pdf.cell(160, 5, f"{group}: {s['mean']:.4f} (+/-{std:.4f}, n={s['n']})", ln=True)
+        rejected = [p for p in result["pairs"] if p["reject"]]
+        if rejected:
+            pdf.cell(160, 5, f"Significant differences (Tukey-Kramer, alpha={ALPHA}):", ln=True)
+            for p in rejected:
+                p_adj = "p<0.001" if p["p_adj"] <= 0.001 else f"p={p['p_adj']:.4f}"
+                pdf.cell(160, 5, f"    {p['group1']} vs {p['group2']}: {p['meandiff']:+.3f} ({p_adj})", ln=True)
+        pdf.image(comparison["category_figures"][category], x=(pdf.w - img_width) / 2, y=None, w=img_width)
+        pdf.ln(5)
+
+    pdf.add_page()
+    pdf.set_font("Times", 'B', 14)
+    pdf.cell(160, 10, "Score Distributions", ln=True)
+    for path in comparison["model_figures"].values():
+        pdf.image(path, x=(pdf.w - img_width) / 2, y=None, w=img_width)
+        pdf.ln(5)
+
+    os.makedirs(f"{DATA_FOLDER_PATH}/reports", exist_ok=True)
+    pdf_path = f"{DATA_FOLDER_PATH}/reports/{name}_comparison_report.pdf"
+    pdf.output(pdf_path)
+    if open_report:
+        subprocess.run(["open", pdf_path], check=True)
+    return pdf_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cross-run comparison report, reusing cached sections.")
+    parser.add_argument("prefixes", nargs="*", help=f"runs to compare (default: {', '.join(DEFAULT_PREFIXES)})")
+    parser.add_argument("--name", default="models", help="name of the report file")
+    parser.add_argument("--no-open", action="store_true", help="do not open the PDF report")
+    args = parser.parse_args()
+
+    cache = SectionCache()
+    comparison = build_comparison(args.prefixes or DEFAULT_PREFIXES, cache)
+    pdf_path = write_report(comparison, args.name, not args.no_open)
+    print(f"{len(cache.computed)} sections computed, {len(cache.reused)} reused from the cache")
+    print(f"Report written to {pdf_path}")
@@ -11,6 +11,17 @@ TOGETHER_AI_API_KEY = os.getenv('TOGETHER_AI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 XAI_API_KEY = os.getenv('XAI_API_KEY')
 
+# optional base URL override for all OpenAI-compatible and Anthropic clients (e.g. the local stub_server.py)
+LLM_BASE_URL = os.getenv('LLM_BASE_URL')
+
+# optional endpoint spec routing one model over several OpenAI-compatible endpoints (see endpoint_router.py)
+ENDPOINTS_PATH = os.getenv('LLM_ENDPOINTS')
+
+# local CPU inference (model "local", needs torch and transformers): torch threads (0 = torch default)
+# and statements per forward pass
+LOCAL_THREADS = int(os.getenv('LOCAL_THREADS', '0'))
+LOCAL_BATCH_SIZE = int(os.getenv('LOCAL_BATCH_SIZE', '8'))
+
 
 # Sytstem prompts: 
 SYSTEM_PROMPT="""
@@ -37,9 +48,35 @@ Examples:
     It is generally considered acceptable to return a faulty item and request for a refund.
 """
 
+SYSTEM_PROMPT_PACKED="""
+You will be presented with a numbered list of statements. Please rate each statement on a 5 point scale from 1 = 'strongly believe that it is wrong' to 5 = 'strongly believe that it is not wrong'
+Rate every statement on its own, independently of the other statements in the list.
+Format your response as following:
+    A JSON object with a "scores" list holding one entry per statement, each with the statement's number as "id" and your rating (a single digit) as "score". Nothing more, nothing less.
+"""
+
 
 # data paths
 PATH_TO_QUESTIONS = os.path.join("resources", "CES_questionnaire.md")
 PATH_TO_CONTEMP_QUESTIONS = os.path.join("resources", "contemporary_CES.md")
 DATA_FOLDER_PATH = os.path.join("resources", "data")
-STATE_FILE = os.path.join("src", "config", "state.json")
\ No newline at end of file
+STATE_FILE = os.path.join("src", "config", "state.json")
+CACHE_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "cache")
+WORK_QUEUE_PATH = os.path.join(DATA_FOLDER_PATH, "queue.db")
+BENCHMARK_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "benchmarks")
+
+# seconds before the API clients give up on a request
+REQUEST_TIMEOUT = 60
+
+
+# short labels for the questionnaire category headings (### in the markdown files),
+# headings not listed here are labelled with their lowercased text
+CATEGORY_LABELS = {
+    "Proactively Benefitting at the Expense of the Seller": "active",
+    "Passively Benefitting at the Expense of the Seller": "passive",
+    "Questionable, but legal actions": "questionable",
+    "No harm, no foul": "no harm",
+    "Downloading copyrighted materials/buying counterfeit goods": "downloading",
+    "Recycling/environmental awareness": "recycling",
+    "Doing the right thing/doing good": "doing good",
+}
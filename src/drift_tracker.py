@@ -0,0 +1,309 @@
+"""
+Longitudinal drift tracking of repeated runs of the same model and prompt.
+
+The score counts per question (the sufficient statistics of a run) are appended to a time-series store in
+resources/data/drift/<series>/:
+
+    runs.csv         one row per run (name, time, raw data hash)
+    counts.csv       score counts (1-5) per run and question, append-only
+    questions.csv    per-question drift of every run against the rolling window
+    categories.csv   per-category means of every run with the window's control limits
+    window.json      score counts of the last `window` runs
+
+A new run is tested against the pooled counts of the window (chi-square test of the score distribution and
+the mean shift per question, Benjamini-Hochberg over the questions) and its category means against a
+prediction interval from the window's category means (t distribution, 3 sigma for long windows).
+Adding a run reads only its raw data and window.json, and the trend chart only categories.csv, so the
+cost does not grow with the history.
+
+Usage (from the repository root):
+    python src/drift_tracker.py add <series> <prefix> [prefix ...] [--window 10]
+    python src/drift_tracker.py chart <series>
+
+`add` ingests resources/data/raw_data/<prefix>_raw_data.csv as the next run(s) of the series, main.py does
+the same after every collect when TRACK_DRIFT is set. The chart is written to plots/drift/<series>.png.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from scipy import stats
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire
+
+DRIFT_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "drift")
+DRIFT_PLOT_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "plots", "drift")
+SCORES = np.arange(1, 6)
+WINDOW = 10         # runs in the rolling history
+ALPHA = 0.05        # false discovery rate of the per-question tests
+CONTROL_P = 0.0027  # two-sided level of the category control limits (3 sigma)
+
+RUN_COLUMNS = ["run", "time", "sha256"]
+COUNT_COLUMNS = ["run", "#", *[f"n_{s}" for s in SCORES]]
+QUESTION_COLUMNS = ["run", "#", "n", "mean", "window_n", "window_mean", "mean_diff", "tvd", "chi2_p", "q", "drift"]
+CATEGORY_COLUMNS = ["run", "category", "mean", "window_mean", "window_std", "limit", "t", "drift"]
+
+
+def run_counts(raw_path: str, question_ids: np.ndarray) -> np.ndarray:
+    """(questions x 5) score counts of a raw data file, invalid answers and unknown questions are left out."""
+    ids, responses = [], []
+    with open(raw_path, "r", newline="") as f:
+        reader = csv.DictReader(f)
+        # raw data files of earlier versions of main.py
+        column = "Response" if "Response" in reader.fieldnames else "Answers"
+        for row in reader:
+            ids.append(row["#"])
+            responses.append(row[column])
+    ids = np.asarray(ids, dtype=np.int64)
+    scores = np.array([float(r) if r.strip().replace(".", "", 1).isdigit() else np.nan for r in responses])
+
+    pos = np.searchsorted(question_ids, ids).clip(max=len(question_ids) - 1)
+    keep = np.isin(scores, SCORES) & (question_ids[pos] == ids)
+    flat = pos[keep] * len(SCORES) + scores[keep].astype(int) - 1
+    return np.bincount(flat, minlength=len(question_ids) * len(SCORES)).reshape(len(question_ids), len(SCORES))
+
+
+def moments(counts: np.ndarray) -> tuple:
+    """Number of answers and mean score along the score axis of count arrays (..., 5)."""
+    n = counts.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return n, (counts @ SCORES) / n
+
+
+def chi2_pvalues(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Chi-square test of homogeneity for every question at once (like scipy's chi2_contingency per row pair,
+    with the Yates correction for one degree of freedom). NaN where a run has no answers.
+    """
+    table = np.stack([a, b], axis=1).astype(float)      # (questions x 2 x 5)
+    rows = table.sum(axis=2, keepdims=True)
+    cols = table.sum(axis=1, keepdims=True)
+    total = rows.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        expected = rows * cols / total
+    used = cols > 0
+    dof = used.sum(axis=(1, 2)) - 1
+
+    diff = np.abs(table - expected)
+    diff = np.where((dof == 1)[:, None, None], np.maximum(diff - 0.5, 0), diff)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stat = np.where(used, diff ** 2 / expected, 0).sum(axis=(1, 2))
+    p = np.where(dof > 0, stats.chi2.sf(stat, np.maximum(dof, 1)), 1.0)
+    return np.where((rows[:, 0, 0] > 0) & (rows[:, 1, 0] > 0), p, np.nan)
+
+
+def fdr(p: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (q-values), NaN stays NaN."""
+    q = np.full(len(p), np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    order = valid[np.argsort(p[valid])]
+    adjusted = p[order] * len(order) / np.arange(1, len(order) + 1)
+    q[order] = np.minimum(np.minimum.accumulate(adjusted[::-1])[::-1], 1)
+    return q
+
+
+def drift_tests(counts: np.ndarray, window: np.ndarray, membership: np.ndarray) -> tuple:
+    """
+    Drift of one run against the rolling window.
+
+    Parameters:
+    counts (np.ndarray): (questions x 5) score counts of the new run
+    window (np.ndarray): (runs x questions x 5) score counts of the runs in the window, may be empty
+    membership (np.ndarray): (categories x questions) boolean category masks
+
+    Returns:
+    tuple: dict of per-question arrays and dict of per-category arrays (QUESTION_COLUMNS/CATEGORY_COLUMNS)
+    """
+    n, mean = moments(counts)
+    pooled = window.sum(axis=0) if len(window) else np.zeros_like(counts)
+    window_n, window_mean = moments(pooled)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tvd = 0.5 * np.abs(counts / n[:, None] - pooled / window_n[:, None]).sum(axis=1)
+    p = chi2_pvalues(counts, pooled)
+    q = fdr(p)
+    questions = {
+        "n": n, "mean": mean, "window_n": window_n, "window_mean": window_mean, "mean_diff": mean - window_mean,
+        "tvd": tvd, "chi2_p": p, "q": q, "drift": q < ALPHA,
+    }
+
+    # category mean of a run: all its answers in the category, the window gives their run-to-run spread
+    def category_means(c):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return ((c @ SCORES) @ membership.T) / (c.sum(axis=-1) @ membership.T)
+
+    cat_mean = category_means(counts)
+    k = len(window)
+    history = category_means(window) if k else np.empty((0, len(membership)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        window_cat = history.mean(axis=0) if k else np.full(len(membership), np.nan)
+        window_std = history.std(axis=0, ddof=1) if k > 1 else np.full(len(membership), np.nan)
+        # prediction interval of one more run from k runs
+        scale = window_std * np.sqrt(1 + 1 / max(k, 1))
+        t = (cat_mean - window_cat) / scale
+    limit = stats.t.isf(CONTROL_P / 2, k - 1) * scale if k > 1 else np.full(len(membership), np.nan)
+    categories = {
+        "mean": cat_mean, "window_mean": window_cat, "window_std": window_std, "limit": limit, "t": t,
+        "drift": np.abs(cat_mean - window_cat) > limit,
+    }
+    return questions, categories
+
+
+class DriftStore:
+    """Append-only time-series store of one series of runs (see the module docstring for the files)."""
+
+    def __init__(self, series: str, folder: str = DRIFT_FOLDER_PATH):
+        self.series = series
+        self.folder = os.path.join(folder, series)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def load_window(self) -> dict:
+        if not os.path.exists(self.path("window.json")):
+            return {"runs": 0, "window": WINDOW, "hashes": [], "names": [], "counts": []}
+        with open(self.path("window.json"), "r") as f:
+            return json.load(f)
+
+    def save_window(self, state: dict):
+        tmp = self.path("window.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path("window.json"))
+
+    def append(self, name: str, columns: list, rows: list):
+        path = self.path(name)
+        new = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(columns)
+            writer.writerows(rows)
+
+
+def _cell(value) -> str:
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:.6g}"
+    return str(value)
+
+
+def add_run(series: str, raw_path: str, index=None, window: int = None, name: str = None) -> dict:
+    """
+    Append a run to a series and test it against the rolling window.
+
+    Parameters:
+    series (str): name of the series, e.g. the run prefix without its counter
+    raw_path (str): raw data CSV of the run
+    window (int, optional): runs in the rolling history (kept from the first run of the series otherwise)
+    name (str, optional): run name, defaults to <series>_<run number>
+
+    Returns:
+    dict: run name, number of drifting questions and categories, or {"skipped": ...} if the same raw data
+        was added before
+    """
+    index = index or load_questionnaire(PATH_TO_QUESTIONS)
+    store = DriftStore(series)
+    os.makedirs(store.folder, exist_ok=True)
+    state = store.load_window()
+    if window:
+        state["window"] = window
+
+    with open(raw_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if digest in state["hashes"]:
+        return {"skipped": raw_path}
+
+    counts = run_counts(raw_path, index.ids)
+    history = np.asarray(state["counts"], dtype=np.int64).reshape(-1, len(index.ids), len(SCORES))
+    questions, categories = drift_tests(counts, history, index.membership)
+
+    state["runs"] += 1
+    name = name or f"{series}_{state['runs']}"
+    store.append("runs.csv", RUN_COLUMNS, [[name, datetime.now().isoformat(timespec="seconds"), digest]])
+    store.append("counts.csv", COUNT_COLUMNS, [[name, i, *row] for i, row in zip(index.ids.tolist(), counts.tolist())])
+    store.append("questions.csv", QUESTION_COLUMNS, [
+        [name, i, *(_cell(questions[c][k]) for c in QUESTION_COLUMNS[2:])] for k, i in enumerate(index.ids.tolist())
+    ])
+    store.append("categories.csv", CATEGORY_COLUMNS, [
+        [name, label, *(_cell(categories[c][k]) for c in CATEGORY_COLUMNS[2:])] for k, label in enumerate(index.labels)
+    ])
+
+    # the window keeps the newest runs only, older counts stay in counts.csv
+    state["hashes"].append(digest)
+    state["names"] = (state["names"] + [name])[-state["window"]:]
+    state["counts"] = (state["counts"] + [counts.tolist()])[-state["window"]:]
+    store.save_window(state)
+
+    return {
+        "run": name,
+        "window_runs": len(history),
+        "drifting_questions": int(questions["drift"].sum()),
+        "drifting_categories": [lbl for lbl, d in zip(index.labels, categories["drift"]) if d],
+    }
+
+
+def plot_trends(series: str) -> str:
+    """Category means of all runs with the window mean and control limits, one small panel per category."""
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    from plotting_helper import save_figure
+
+    trends = pd.read_csv(DriftStore(series).path("categories.csv"))
+    runs = list(dict.fromkeys(trends["run"]))
+    trends["x"] = trends["run"].map({r: k for k, r in enumerate(runs, start=1)})
+    labels = list(dict.fromkeys(trends["category"]))
+
+    cols = 4
+    rows = -(-len(labels) // cols)
+    fig, axes = plt.subplots(rows, cols, figsize=(3 * cols, 2.2 * rows), sharex=True, squeeze=False)
+    for ax, label in zip(axes.ravel(), labels):
+        t = trends[trends["category"] == label]
+        ax.fill_between(t["x"], t["window_mean"] - t["limit"], t["window_mean"] + t["limit"], color="tab:blue", alpha=0.15, lw=0)
+        ax.plot(t["x"], t["window_mean"], color="tab:blue", lw=0.8, ls="--")
+        ax.plot(t["x"], t["mean"], color="black", lw=1, marker="o", ms=2)
+        flagged = t[t["drift"] == 1]
+        ax.scatter(flagged["x"], flagged["mean"], color="tab:red", s=14, zorder=3)
+        ax.set_title(label, fontsize=9)
+        ax.set_ylim(1, 5)
+        ax.tick_params(labelsize=7)
+    for ax in axes.ravel()[len(labels):]:
+        ax.axis("off")
+    fig.suptitle(f"{series}: category means per run (window mean and control limits, drift in red)", fontsize=10)
+    fig.tight_layout()
+
+    os.makedirs(DRIFT_PLOT_FOLDER_PATH, exist_ok=True)
+    path = os.path.join(DRIFT_PLOT_FOLDER_PATH, f"{series}.png")
+    save_figure(fig, path, dpi=120)
+    plt.close(fig)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track the drift of repeated runs of a model.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="append runs (oldest first) and test them against the rolling window")
+    add.add_argument("series")
+    add.add_argument("prefixes", nargs="+", help="raw data prefixes of the runs")
+    add.add_argument("--window", type=int, default=None, help=f"runs in the rolling history (default {WINDOW})")
+    chart = sub.add_parser("chart", help="trend chart of the category means")
+    chart.add_argument("series")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        index = load_questionnaire(PATH_TO_QUESTIONS)
+        for prefix in args.prefixes:
+            result = add_run(args.series, f"{DATA_FOLDER_PATH}/raw_data/{prefix}_raw_data.csv", index, args.window)
+            if "skipped" in result:
+                print(f"{prefix}: already in {args.series}, skipped")
+                continue
+            drifting = ", ".join(result["drifting_categories"]) or "none"
+            print(f"{prefix} -> {result['run']}: {result['drifting_questions']} drifting questions "
+                  f"(vs. {result['window_runs']} runs), drifting categories: {drifting}")
+    else:
+        print(f"Trend chart written to {plot_trends(args.series)}")
@@ -0,0 +1,220 @@
+"""
+Routing of one logical model over several OpenAI-compatible endpoints.
+
+An endpoint spec (JSON, path in LLM_ENDPOINTS) maps a model name to endpoint/key pairs, e.g.
+resources/misc/endpoints_example.json:
+    {
+        "meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo": [
+            {"name": "together", "base_url": "https://api.together.xyz/v1", "api_key_env": "TOGETHER_AI_API_KEY"},
+            {"name": "deepinfra", "base_url": "https://api.deepinfra.com/v1/openai",
+             "api_key_env": "DEEPINFRA_API_KEY", "model": "meta-llama/Meta-Llama-3.1-70B-Instruct"}
+        ]
+    }
+
+Every request goes to the endpoint with the lowest expected wait, (outstanding + 1) * EWMA latency,
+inflated by its EWMA error rate. Endpoints without a measurement yet are tried first. An endpoint failing
+EJECT_AFTER times in a row (or with an error rate above MAX_ERROR_RATE) is ejected for EJECT_SECONDS,
+doubling with every ejection in a row, and a failed request is retried once on every other endpoint.
+Only connection errors, timeouts and 5xx responses count as failures. A rate limited endpoint (429) is
+skipped for its Retry-After (or BACKOFF_SECONDS) without counting against it, and any other error, e.g.
+a 400 for a bad request, is raised right away: it would fail on every endpoint alike.
+Models without an entry in the spec use the single client llm_client picks for them.
+"""
+import json
+import os
+import threading
+import time
+
+from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
+
+from config.configuration import ENDPOINTS_PATH, REQUEST_TIMEOUT
+
+EWMA_ALPHA = 0.2        # weight of the newest latency/error measurement
+EJECT_AFTER = 3         # consecutive failures
+MAX_ERROR_RATE = 0.5
+MIN_REQUESTS = 10       # before the error rate can eject an endpoint
+EJECT_SECONDS = 10
+MAX_EJECT_SECONDS = 300
+BACKOFF_SECONDS = 5     # skip a rate limited endpoint without Retry-After for this long
+
+
+class Endpoint:
+    """One endpoint/key pair of a routed model with its live latency and error estimates."""
+
+    def __init__(self, name: str, client, model: str):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.latency = None         # EWMA seconds per successful request
+        self.error_rate = 0.0       # EWMA share of failed requests
+        self.outstanding = 0
+        self.failures = 0           # in a row
+        self.ejections = 0          # in a row
+        self.ejected_until = 0.0
+        self.throttled_until = 0.0  # rate limited, not ejected
+        self.served = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "served": self.served,
+            "errors": self.errors,
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "ejected": self.ejected_until > time.monotonic(),
+            "throttled": self.throttled_until > time.monotonic(),
+        }
+
+
+class Router:
+    """Thread-safe least-expected-wait balancing with temporary ejection of failing endpoints."""
+
+    def __init__(self, endpoints: list, alpha: float = EWMA_ALPHA, eject_after: int = EJECT_AFTER,
+                 max_error_rate: float = MAX_ERROR_RATE, eject_seconds: float = EJECT_SECONDS):
+        self.endpoints = endpoints
+        self.alpha = alpha
+        self.eject_after = eject_after
+        self.max_error_rate = max_error_rate
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def _cost(self, endpoint: Endpoint) -> tuple:
+        if endpoint.latency is None:
+            # unmeasured endpoints first, then spread by requests in flight
+            return 0.0, endpoint.outstanding
+        wait = (endpoint.outstanding + 1) * endpoint.latency / max(1 - endpoint.error_rate, 0.05)
+        return wait, endpoint.outstanding
+
+    def acquire(self, exclude=()) -> Endpoint:
+        """Endpoint for the next request (counted as outstanding until `release`)."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            healthy = [e for e in candidates if max(e.ejected_until, e.throttled_until) <= now]
+            if healthy:
+                endpoint = min(healthy, key=self._cost)
+            else:
+                # all ejected or rate limited: probe the one that comes back first
+                endpoint = min(candidates, key=lambda e: max(e.ejected_until, e.throttled_until))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, elapsed: float, failed: bool = False):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.error_rate += self.alpha * (float(failed) - endpoint.error_rate)
+            if not failed:
+                endpoint.latency = elapsed if endpoint.latency is None else \
+                    endpoint.latency + self.alpha * (elapsed - endpoint.latency)
+                endpoint.served += 1
+                endpoint.failures = 0
+                endpoint.ejections = 0
+                return
+
+            endpoint.errors += 1
+            endpoint.failures += 1
+            requests = endpoint.served + endpoint.errors
+            if endpoint.failures >= self.eject_after or \
+                    (requests >= MIN_REQUESTS and endpoint.error_rate > self.max_error_rate):
+                seconds = min(self.eject_seconds * 2 ** endpoint.ejections, MAX_EJECT_SECONDS)
+                endpoint.ejected_until = time.monotonic() + seconds
+                endpoint.ejections += 1
+                endpoint.failures = 0
+
+    def throttle(self, endpoint: Endpoint, seconds: float = None):
+        """Release a rate limited request and skip its endpoint for `seconds`, its health is not affected."""
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.throttled_until = time.monotonic() + (seconds or BACKOFF_SECONDS)
+
+    def discard(self, endpoint: Endpoint):
+        """Release a request that failed for reasons of its own (e.g. a bad request), not the endpoint's."""
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def call(self, request: callable):
+        """
+        Run `request(client, model)` on the best endpoint, on a failure or rate limit once on each of the others.
+
+        Returns:
+        tuple: the request's result and the name of the endpoint that served it
+        """
+        tried = []
+        while True:
+            endpoint = self.acquire(tried)
+            start = time.perf_counter()
+            try:
+                result = request(endpoint.client, endpoint.model)
+            except (APIConnectionError, InternalServerError) as e:
+                # includes timeouts (APITimeoutError)
+                self.release(endpoint, time.perf_counter() - start, failed=True)
+                error = e
+            except RateLimitError as e:
+                self.throttle(endpoint, retry_after(e))
+                error = e
+            except Exception:
+                self.discard(endpoint)
+                raise
+            else:
+                self.release(endpoint, time.perf_counter() - start)
+                return result, endpoint.name
+            tried.append(endpoint)
+            if len(tried) >= len(self.endpoints):
+                raise error
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {e.name: e.snapshot() for e in self.endpoints}
+
+
+def retry_after(error: RateLimitError):
+    """Seconds from the Retry-After header of a 429 response, None if it has none."""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def load_endpoints(path: str = ENDPOINTS_PATH) -> dict:
+    """{model: Router} of an endpoint spec, API keys are read from the environment variables it names."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        spec = json.load(f)
+
+    routers = {}
+    for model, entries in spec.items():
+        endpoints = []
+        for n, entry in enumerate(entries):
+            # no SDK retries: a failed request goes to the next endpoint right away
+            client = OpenAI(
+                api_key=os.getenv(entry.get("api_key_env", ""), entry.get("api_key", "none")),
+                base_url=entry["base_url"],
+                timeout=REQUEST_TIMEOUT,
+                max_retries=0,
+            )
+            endpoints.append(Endpoint(entry.get("name", str(n)), client, entry.get("model", model)))
+        routers[model] = Router(endpoints)
+    return routers
+
+
+_routers = None
+_routers_lock = threading.Lock()
+
+
+def get_router(model: str):
+    """Router of a model, None if the model is not in the endpoint spec."""
+    global _routers
+    with _routers_lock:
+        if _routers is None:
+            _routers = load_endpoints()
+    return _routers.get(model)
+
+
+def routing_snapshot() -> dict:
+    """Per-endpoint counters of all routed models used so far."""
+    with _routers_lock:
+        routers = dict(_routers or {})
+    return {model: router.snapshot() for model, router in routers.items() if any(
+        e.served or e.errors for e in router.endpoints
+    )}
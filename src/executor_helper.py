@@ -0,0 +1,193 @@
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+MAX_IN_FLIGHT = 64
+HEDGE_QUANTILE = 0.95   # a duplicate is sent when a call runs longer than this quantile of recent latencies
+HEDGE_WORKERS = 8       # hedges run on their own threads so they do not queue behind the regular calls
+LATENCY_WINDOW = 500    # recent latencies the quantile is taken over
+MIN_LATENCY_SAMPLES = 20
+POLL_SECONDS = 0.05
+
+
+def run_bounded(executor: concurrent.futures.Executor, calls: Iterable, max_in_flight: int = MAX_IN_FLIGHT) -> Iterator:
+    """
+    Submit calls lazily so that at most `max_in_flight` of them are queued or running at any time,
+    and yield their results as they finish.
+
+    Parameters:
+    executor (Executor): executor to run the calls on
+    calls (iterable): (fn, args, kwargs) tuples, consumed only as fast as results come back
+    max_in_flight (int): size of the submission window
+
+    Returns:
+    iterator: results in completion order, the first exception raised by a call is re-raised
+    """
+    calls = iter(calls)
+    pending = set()
+
+    def fill():
+        for fn, args, kwargs in calls:
+            pending.add(executor.submit(fn, *args, **kwargs))
+            if len(pending) >= max_in_flight:
+                return
+
+    fill()
+    try:
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            pending.difference_update(done)
+            fill()
+            for future in done:
+                yield future.result()
+    finally:
+        # on errors or when the consumer stops early, do not start what is still queued
+        for future in pending:
+            future.cancel()
+
+
+class LatencyTracker:
+    """Recent request latencies of one provider, thread-safe."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_LATENCY_SAMPLES):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """The q-quantile of the recent latencies, None until there are min_samples of them."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+TRACKERS = {}
+
+
+def get_tracker(provider: str) -> LatencyTracker:
+    # one tracker per provider, kept across runs of the same process
+    return TRACKERS.setdefault(provider, LatencyTracker())
+
+
+class _Attempt:
+    # one execution of a call, with the times it actually started and ended on its thread
+    def __init__(self):
+        self.start = None
+        self.end = None
+
+    def run(self, fn, args, kwargs):
+        self.start = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end = time.monotonic()
+
+
+def run_hedged(executor: concurrent.futures.Executor, calls: Iterable, max_in_flight: int = MAX_IN_FLIGHT,
+               deadline: float = None, tracker: LatencyTracker = None, hedge_quantile: float = HEDGE_QUANTILE,
+               hedge_budget: float = 0.0, stats: dict = None) -> Iterator:
+    """
+    Like run_bounded, with a deadline per call and optional hedging of slow calls.
+
+    A call that has been running longer than the tracker's `hedge_quantile` latency is sent a second time
+    (on separate threads) and the first result wins, the other attempt is cancelled if it has not started
+    and its result is ignored otherwise. A call still unanswered `deadline` seconds after it started is
+    given up and yields nothing.
+
+    Parameters:
+    executor (Executor): executor to run the calls on
+    calls (iterable): (fn, args, kwargs) tuples, consumed only as fast as results come back
+    max_in_flight (int): size of the submission window (hedges are not counted)
+    deadline (float, optional): seconds a call may run before it is given up, None waits forever
+    tracker (LatencyTracker, optional): latencies of the provider, updated with every finished call
+    hedge_quantile (float): latency quantile that triggers a hedge
+    hedge_budget (float): hedges allowed as a share of the calls started so far, 0 disables hedging
+    stats (dict, optional): receives the counts of calls, hedged calls, hedges that won and timed-out calls
+
+    Returns:
+    iterator: results in completion order, an exception is re-raised once every attempt of its call failed
+    """
+    calls = iter(calls)
+    stats = stats if stats is not None else {}
+    for key in ("calls", "hedged", "hedge_wins", "timed_out"):
+        stats.setdefault(key, 0)
+    hedging = hedge_budget > 0 and tracker is not None
+    hedge_pool = concurrent.futures.ThreadPoolExecutor(HEDGE_WORKERS) if hedging else None
+    timeout = POLL_SECONDS if hedging or deadline is not None else None
+    owner = {}      # future -> call it is an attempt of
+    active = []     # calls in flight: {"fn", "args", "kwargs", "attempts": [(future, attempt), ...]}
+
+    def submit(call, pool):
+        attempt = _Attempt()
+        future = pool.submit(attempt.run, call["fn"], call["args"], call["kwargs"])
+        call["attempts"].append((future, attempt))
+        owner[future] = call
+
+    def fill():
+        while len(active) < max_in_flight:
+            try:
+                fn, args, kwargs = next(calls)
+            except StopIteration:
+                return
+            call = {"fn": fn, "args": args, "kwargs": kwargs, "attempts": []}
+            active.append(call)
+            stats["calls"] += 1
+            submit(call, executor)
+
+    def finish(call):
+        active.remove(call)
+        for future, _ in call["attempts"]:
+            future.cancel()
+            owner.pop(future, None)
+
+    fill()
+    try:
+        while active:
+            done, _ = concurrent.futures.wait(list(owner), timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            results = []
+            for future in done:
+                call = owner.pop(future, None)
+                if call is None:
+                    continue    # the other attempt of its call already won
+                if future.exception() is not None:
+                    if any(f in owner for f, _ in call["attempts"]):
+                        continue    # the other attempt may still succeed
+                    finish(call)
+                    raise future.exception()
+                attempt = next(a for f, a in call["attempts"] if f is future)
+                if tracker is not None:
+                    tracker.add(attempt.end - attempt.start)
+                if future is not call["attempts"][0][0]:
+                    stats["hedge_wins"] += 1
+                finish(call)
+                results.append(future.result())
+
+            now = time.monotonic()
+            threshold = tracker.quantile(hedge_quantile) if hedging else None
+            # longest-running calls first, they get the hedges while the budget is short
+            running = [(now - c["attempts"][0][1].start, c) for c in active if c["attempts"][0][1].start is not None]
+            for elapsed, call in sorted(running, key=lambda item: -item[0]):
+                if deadline is not None and elapsed > deadline:
+                    stats["timed_out"] += 1
+                    finish(call)
+                elif (threshold is not None and len(call["attempts"]) == 1 and elapsed > threshold
+                      and stats["hedged"] < hedge_budget * stats["calls"]):
+                    stats["hedged"] += 1
+                    submit(call, hedge_pool)
+
+            fill()
+            yield from results
+    finally:
+        for future in owner:
+            future.cancel()
+        if hedge_pool is not None:
+            hedge_pool.shutdown(wait=False, cancel_futures=True)
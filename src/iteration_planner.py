@@ -0,0 +1,178 @@
+"""
+Variance-driven iteration budget planner.
+
+Instead of asking every question NUM_ITR times, the planner reads earlier runs of a model, estimates
+the spread of the answers per question and gives each question the number of iterations it needs:
+
+    target CI width w: n_q = (2 * z * s_q / w)^2     (so the mean's confidence interval is about w wide)
+    total budget B:    n_q ~ B * s_q / sum(s)         (Neyman allocation, minimizes the mean CI width)
+
+With both, the CI targets are used while they fit into the budget and scaled down by Neyman allocation
+otherwise. Every question gets at least `min_itr` iterations, and the spread is floored at `min_std`
+because a question answered identically in the past may still vary in a new run.
+
+Usage (from the repository root):
+    python src/iteration_planner.py <plan name> <prefix> [prefix ...] [--ci-width 0.5] [--budget 1500]
+
+Writes resources/data/plans/<plan name>.json, which evaluate_CES executes via its `plan` argument
+(or ITERATION_PLAN in main.py).
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire
+from response_tensor import build_tensor, load_runs
+
+PLAN_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "plans")
+Z = 1.96            # 95% confidence
+MIN_ITR = 5
+MIN_STD = 0.25
+
+
+def pooled_stds(tensor) -> np.ndarray:
+    """Standard deviation per question over all answers of all runs in the tensor."""
+    valid = tensor.valid()
+    n = valid.sum(axis=(0, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, tensor.data, 0).sum(axis=(0, 2)) / n
+        sq = (np.where(valid, tensor.data - mean[None, :, None], 0.0) ** 2).sum(axis=(0, 2))
+        return np.sqrt(sq / (n - 1))
+
+
+def required_iterations(stds: np.ndarray, ci_width: float, z: float = Z) -> np.ndarray:
+    """Iterations per question for a confidence interval of the mean about `ci_width` wide."""
+    return np.ceil((2 * z * stds / ci_width) ** 2).astype(int)
+
+
+def neyman_allocation(stds: np.ndarray, budget: int, lower: np.ndarray, upper: np.ndarray = None) -> np.ndarray:
+    """
+    Split `budget` proportionally to the standard deviations, respecting per-question bounds.
+    Questions that hit a bound are fixed and the rest of the budget is re-split among the others.
+    """
+    if lower.sum() > budget:
+        raise ValueError(f"The lower bounds ({lower.sum()} calls) exceed the budget of {budget} calls.")
+    n = len(stds)
+    upper = np.full(n, np.inf) if upper is None else upper.astype(float)
+    alloc = lower.astype(float).copy()
+    free = np.ones(n, dtype=bool)
+
+    while free.any():
+        remaining = budget - alloc[~free].sum()
+        weights = stds[free]
+        share = remaining * weights / weights.sum() if weights.sum() > 0 else np.full(free.sum(), remaining / free.sum())
+        candidate = alloc.copy()
+        candidate[free] = share
+        low = free & (candidate < lower)
+        high = free & (candidate > upper)
+        if not (low.any() or high.any()):
+            alloc = candidate
+            break
+        alloc[low] = lower[low]
+        alloc[high] = upper[high]
+        free &= ~(low | high)
+
+    # integer iterations without exceeding the budget: floor, then hand out the rest by largest remainder
+    result = np.floor(alloc).astype(int)
+    result = np.maximum(result, lower)
+    leftover = int(budget - result.sum())
+    if leftover > 0:
+        room = (upper - result) > 0
+        order = np.argsort(-(alloc - np.floor(alloc)) * room)
+        for k in order[:leftover]:
+            if room[k]:
+                result[k] += 1
+    return result
+
+
+def plan_iterations(stds: np.ndarray, ci_width: float = None, budget: int = None, z: float = Z,
+                    min_itr: int = MIN_ITR, min_std: float = MIN_STD) -> np.ndarray:
+    """
+    Iterations per question from their (historical) standard deviations.
+
+    Parameters:
+    stds (np.ndarray): standard deviation per question, NaN for questions without history
+    ci_width (float, optional): target width of the 95% confidence interval of each question's mean
+    budget (int, optional): total number of calls for the whole questionnaire
+
+    Returns:
+    np.ndarray: iterations per question, at most `budget` in total
+    """
+    if ci_width is None and budget is None:
+        raise ValueError("Either a target CI width or a total budget is required.")
+    if budget is not None and budget < min_itr * len(stds):
+        raise ValueError(
+            f"A budget of {budget} calls cannot give {len(stds)} questions at least {min_itr} iterations each "
+            f"({min_itr * len(stds)} calls), raise the budget or lower min_itr (--min-itr)."
+        )
+
+    # no history: assume the largest spread seen, tiny spreads are floored
+    stds = np.where(np.isnan(stds), np.nanmax(stds) if np.isfinite(stds).any() else 1.0, stds)
+    stds = np.maximum(stds, min_std)
+    lower = np.full(len(stds), min_itr)
+
+    if ci_width is not None:
+        need = np.maximum(required_iterations(stds, ci_width, z), lower)
+        if budget is None or need.sum() <= budget:
+            return need
+        return neyman_allocation(stds, budget, lower, need)
+    return neyman_allocation(stds, budget, lower)
+
+
+def save_plan(name: str, index, iterations: np.ndarray, meta: dict) -> str:
+    os.makedirs(PLAN_FOLDER_PATH, exist_ok=True)
+    path = os.path.join(PLAN_FOLDER_PATH, f"{name}.json")
+    plan = dict(meta)
+    plan["iterations"] = {str(i): int(n) for i, n in zip(index.ids.tolist(), iterations)}
+    plan["total"] = int(iterations.sum())
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=2)
+    return path
+
+
+def load_plan(path: str) -> dict:
+    """{question number: iterations} of a plan file."""
+    if not os.path.exists(path):
+        path = os.path.join(PLAN_FOLDER_PATH, f"{path}.json")
+    with open(path, "r") as f:
+        plan = json.load(f)
+    return {int(i): int(n) for i, n in plan["iterations"].items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan iterations per question from earlier runs of a model.")
+    parser.add_argument("name", help="name of the plan file")
+    parser.add_argument("prefixes", nargs="+", help="earlier runs (raw data prefixes) of the model")
+    parser.add_argument("--ci-width", type=float, default=None, help="target width of the 95%% CI of each mean")
+    parser.add_argument("--budget", type=int, default=None, help="total number of calls")
+    parser.add_argument("--min-itr", type=int, default=MIN_ITR)
+    parser.add_argument("--min-std", type=float, default=MIN_STD)
+    args = parser.parse_args()
+
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    tensor = build_tensor(load_runs(args.prefixes, index), index)
+    stds = pooled_stds(tensor)
+    try:
+        iterations = plan_iterations(stds, args.ci_width, args.budget, min_itr=args.min_itr, min_std=args.min_std)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # half-width the planned iterations actually give for every question
+    half_widths = Z * np.maximum(np.nan_to_num(stds, nan=np.nanmax(stds)), args.min_std) / np.sqrt(iterations)
+    path = save_plan(args.name, index, iterations, {
+        "history": args.prefixes,
+        "ci_width": args.ci_width,
+        "budget": args.budget,
+        "std": {str(i): None if math.isnan(s) else round(float(s), 4) for i, s in zip(index.ids.tolist(), stds)},
+    })
+
+    uniform = tensor.shape[2] * len(index)
+    print(f"{'#':>3}{'std':>8}{'iterations':>12}{'CI width':>10}")
+    for i, s, n, h in zip(index.ids, stds, iterations, half_widths):
+        print(f"{i:>3}{s:>8.3f}{n:>12}{2 * h:>10.3f}")
+    print(f"\nTotal calls: {iterations.sum()} (uniform {tensor.shape[2]} iterations: {uniform})")
+    print(f"Plan written to {path}")
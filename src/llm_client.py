@@ -1,4 +1,10 @@
 import os
+import re
+import json
+import threading
+import time
+import concurrent.futures
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,24 +14,143 @@ from anthropic import Anthropic
 from together import Together
 from google.generativeai import GenerativeModel, configure
 
+from endpoint_router import get_router
+from executor_helper import MAX_IN_FLIGHT
 from config.configuration import (
     OPENAI_API_KEY_HfP,
     ANTHROPIC_API_KEY,
     TOGETHER_AI_API_KEY,
     GEMINI_API_KEY,
     XAI_API_KEY,
-    SYSTEM_PROMPT
+    LLM_BASE_URL,
+    LOCAL_THREADS,
+    LOCAL_BATCH_SIZE,
+    REQUEST_TIMEOUT,
+    SYSTEM_PROMPT,
+    SYSTEM_PROMPT_PACKED,
+    SYSTEM_PROMPT_REASIONING,
 )
 
 
-# instantiate all model clients
-client_gpt = OpenAI(api_key=OPENAI_API_KEY_HfP)
-client_claude = Anthropic(api_key=ANTHROPIC_API_KEY)
+# instantiate all model clients (LLM_BASE_URL points all of them at a local stand-in server, see stub_server.py)
+# a hung request is abandoned after REQUEST_TIMEOUT so it does not hold an executor thread forever
+client_gpt = OpenAI(api_key=OPENAI_API_KEY_HfP, base_url=LLM_BASE_URL, timeout=REQUEST_TIMEOUT)
+client_claude = Anthropic(api_key=ANTHROPIC_API_KEY, base_url=LLM_BASE_URL, timeout=REQUEST_TIMEOUT)
 # client_together = Together(api_key=TOGETHER_AI_API_KEY)
-client_together = OpenAI(api_key=TOGETHER_AI_API_KEY, base_url="https://api.together.xyz/v1")
+client_together = OpenAI(api_key=TOGETHER_AI_API_KEY, base_url=LLM_BASE_URL or "https://api.together.xyz/v1", timeout=REQUEST_TIMEOUT)
 configure(api_key=GEMINI_API_KEY)
 client_gemini = GenerativeModel("gemini-1.5-flash", system_instruction=SYSTEM_PROMPT)
-client_grok = OpenAI(api_key=XAI_API_KEY, base_url="https://api.x.ai/v1")
+client_grok = OpenAI(api_key=XAI_API_KEY, base_url=LLM_BASE_URL or "https://api.x.ai/v1", timeout=REQUEST_TIMEOUT)
+
+
+class TokenUsage:
+    """
+    Thread-safe token counters for one evaluation run.
+
+    input_tokens counts every prompt token sent, cached_input_tokens the part of it the provider
+    served from its prompt cache and cache_write_tokens the part written to the cache (Anthropic only).
+    fallback_items counts statements of packed requests that had to be re-asked on their own.
+    In constrained mode, unconstrained_requests counts requests where the answer vocabulary could not be
+    restricted to the digits 1-5 (only the one-token cap applied) and invalid_answers the answers that are
+    not a single digit 1-5. request_seconds sums the time spent waiting for responses.
+    hedged_requests counts duplicates sent for slow calls, hedge_wins the calls a duplicate answered first
+    and timed_out_requests the calls given up after their deadline (see executor_helper.run_hedged).
+    In streaming mode, score_seconds sums the time from sending a request to its score arriving (over the
+    streams that had a score, unscored_streams counts the others) and aborted_streams counts streams closed
+    right after the score (their tokens are not reported by the API).
+    """
+
+    FIELDS = (
+        "requests", "input_tokens", "cached_input_tokens", "cache_write_tokens", "output_tokens",
+        "fallback_items", "unconstrained_requests", "invalid_answers", "request_seconds",
+        "hedged_requests", "hedge_wins", "timed_out_requests",
+        "streamed_requests", "unscored_streams", "aborted_streams", "score_seconds",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self._counts[key] += value or 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        counts["uncached_input_tokens"] = counts["input_tokens"] - counts["cached_input_tokens"]
+        counts["mean_request_seconds"] = counts["request_seconds"] / counts["requests"] if counts["requests"] else 0.0
+        streamed = counts["streamed_requests"] - counts["unscored_streams"]
+        counts["mean_score_seconds"] = counts["score_seconds"] / streamed if streamed else 0.0
+        return counts
+
+
+usage = TokenUsage()
+
+
+def build_messages(content: str, system_prompt: str = SYSTEM_PROMPT) -> list:
+    # the shared system prompt always comes first and unchanged so OpenAI-compatible providers can
+    # serve it from their prefix cache, only the statement after it varies between requests
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+
+def choose_client(model: str):
+    # OpenAI-compatible client of a model by its name
+    if "gpt" in model:
+        return client_gpt
+    elif "grok" in model:
+        return client_grok
+    return client_together
+
+
+def route(model: str, request: callable) -> tuple:
+    """
+    Run `request(client, model)` on the model's endpoints (see endpoint_router.py) or its single client.
+
+    Returns:
+    tuple: the request's result and the serving endpoint's name (None without routing)
+    """
+    router = get_router(model)
+    if router is None:
+        return request(choose_client(model), model), None
+    return router.call(request)
+
+
+def with_endpoint(row: list, endpoint: str) -> list:
+    # routed rows carry the name of the serving endpoint as a fifth column
+    return row + [endpoint] if endpoint else row
+
+
+def record_openai_usage(response, elapsed=0.0):
+    u = getattr(response, "usage", None)
+    if u is None:
+        usage.add(requests=1, request_seconds=elapsed)
+        return
+    details = getattr(u, "prompt_tokens_details", None)
+    usage.add(
+        requests=1,
+        request_seconds=elapsed,
+        input_tokens=u.prompt_tokens,
+        cached_input_tokens=getattr(details, "cached_tokens", 0) if details else 0,
+        output_tokens=u.completion_tokens,
+    )
+
+
+# constrained answer mode: token ids of the digits "1"-"5" in the tokenizers of the GPT-3.5/4/4o models
+# (cl100k_base and o200k_base), used to restrict the one-token answer with logit_bias
+DIGIT_TOKEN_IDS = {"gpt": [16, 17, 18, 19, 20]}
+VALID_SCORES = ("1", "2", "3", "4", "5")
+
+
+def check_score(answer: str) -> str:
+    if answer not in VALID_SCORES:
+        usage.add(invalid_answers=1)
+    return answer
 
 
 # GPT
@@ -33,42 +158,465 @@ def get_response(content: str, model="gpt-4o-mini", temperature=1):
     response = client_gpt.chat.completions.create(
         model=model,
         temperature=temperature,
-        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": content}],
+        messages=build_messages(content),
         max_completion_tokens=200       # current sys prompt (v2) is 154 tokens long | potential max = 160
     )
+    record_openai_usage(response)
     return response
 
 
 # GPT with threading
-def get_response_t(content: str, i: int, j: int, model="gpt-4o-mini", max_tokens=200, temperature=1):
-    if "gpt" in model:
-        client = client_gpt
-    elif "grok" in model:
-        client = client_grok
+def get_response_t(content: str, i: int, j: int, model="gpt-4o-mini", max_tokens=200, temperature=1, system_prompt=SYSTEM_PROMPT, constrained=False):
+    kwargs = {}
+    if constrained:
+        max_tokens = 1
+        if "gpt" in model:
+            kwargs["logit_bias"] = {str(t): 100 for t in DIGIT_TOKEN_IDS["gpt"]}
+        else:
+            # digit token ids of Grok/Together models are unknown, only the one-token cap applies
+            usage.add(unconstrained_requests=1)
+
+    def request(client, name):
+        return client.chat.completions.create(
+            model=name,
+            temperature=temperature,
+            messages=build_messages(content, system_prompt),
+            max_completion_tokens=max_tokens,
+            **kwargs
+        )
+
+    start = time.perf_counter()
+    response, endpoint = route(model, request)
+    record_openai_usage(response, time.perf_counter() - start)
+    answer = response.choices[0].message.content.strip()
+    if constrained:
+        answer = check_score(answer)
+    return with_endpoint([i, content, j, answer], endpoint)
+
+
+# streaming: the score is the first digit 1-5 that is not part of a longer number
+SCORE_PATTERN = re.compile(r"(?<!\d)([1-5])(?!\d)")
+STREAM_MODES = ("abort", "collect")
+
+
+class ReasoningLog:
+    """
+    Reasoning texts that are read to the end of their streams in the background after the score was returned.
+
+    At most `workers` streams are read at a time and `collect` blocks the calling request thread until a
+    reader is free, so open streams count against the submission window (MAX_IN_FLIGHT) instead of piling up.
+    peak is the largest number of streams open at once since the last drain.
+    """
+
+    def __init__(self, workers: int = MAX_IN_FLIGHT):
+        self._rows = []
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._pending = set()
+        self.peak = 0
+
+    def collect(self, fn, *args):
+        self._slots.acquire()
+        future = self._pool.submit(fn, *args)
+        with self._lock:
+            self._pending.add(future)
+            self.peak = max(self.peak, len(self._pending))
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def add(self, row: list):
+        with self._lock:
+            self._rows.append(row)
+
+    def drain(self) -> list:
+        """
+        Wait for all streams still being read and return (and forget) the collected
+        [#, Iteration, Response, Reasoning, Complete] rows.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            concurrent.futures.wait(pending)
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self.peak = 0
+        return sorted(rows, key=lambda row: (row[0], row[1]))
+
+
+reasoning = ReasoningLog()
+
+
+def find_score(text: str, final: bool = False):
+    # a digit at the very end may still be followed by another one unless the stream has ended
+    for ma in SCORE_PATTERN.finditer(text):
+        if ma.end() < len(text) or final:
+            return ma.group(1), ma.end()
+    return None, None
+
+
+def read_reasoning(stream, text: str, end: int, i: int, j: int, score: str, start: float):
+    # rest of a stream after its score, in the background (nobody waits for its future, so nothing may raise)
+    recorded = complete = False
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+            elif getattr(chunk, "usage", None) is not None:
+                record_openai_usage(chunk, time.perf_counter() - start)
+                recorded = True
+        complete = True
+    except Exception:
+        pass
+    finally:
+        stream.close()
+    # a broken stream (or a provider without usage chunks) still counts as a request
+    if not recorded:
+        usage.add(requests=1, request_seconds=time.perf_counter() - start)
+    reasoning.add([i, j, score, text[end:].strip(), int(complete)])
+
+
+def get_response_stream(content: str, i: int, j: int, model="gpt-4o-mini", max_tokens=200, temperature=1,
+                        system_prompt=SYSTEM_PROMPT_REASIONING, on_score="abort"):
+    """
+    Stream the answer of a score-first prompt and return as soon as the score has arrived.
+
+    on_score "abort" closes the stream right after the score (no further tokens are generated), "collect"
+    reads the reasoning to the end in the background (see `reasoning`). Answers without a score are
+    returned in full, like get_response_t does.
+    """
+    if on_score not in STREAM_MODES:
+        raise ValueError(f"Invalid streaming mode: '{on_score}'. Supported modes are: {', '.join(STREAM_MODES)}.")
+
+    # only opening the stream is routed, the endpoint's latency is its time to the first response
+    def request(client, name):
+        return client.chat.completions.create(
+            model=name,
+            temperature=temperature,
+            messages=build_messages(content, system_prompt),
+            max_completion_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+    start = time.perf_counter()
+    stream, endpoint = route(model, request)
+    text = ""
+    recorded = False
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+                score, end = find_score(text)
+                if score is None:
+                    continue
+                usage.add(streamed_requests=1, score_seconds=time.perf_counter() - start)
+                if on_score == "collect":
+                    reasoning.collect(read_reasoning, stream, text, end, i, j, score, start)
+                    stream = None   # closed by read_reasoning
+                else:
+                    usage.add(requests=1, aborted_streams=1, request_seconds=time.perf_counter() - start)
+                return with_endpoint([i, content, j, score], endpoint)
+            elif getattr(chunk, "usage", None) is not None:
+                record_openai_usage(chunk, time.perf_counter() - start)
+                recorded = True
+    finally:
+        if stream is not None:
+            stream.close()
+
+    # stream ended: a score as the last character, or no score at all
+    score, end = find_score(text, final=True)
+    if not recorded:
+        usage.add(requests=1, request_seconds=time.perf_counter() - start)
+    if score is None:
+        usage.add(streamed_requests=1, unscored_streams=1)
     else:
-        client = client_together
+        usage.add(streamed_requests=1, score_seconds=time.perf_counter() - start)
+    if score is not None and on_score == "collect":
+        reasoning.add([i, j, score, text[end:].strip(), 1])
+    return with_endpoint([i, content, j, score if score is not None else text.strip()], endpoint)
+
+
+# JSON schema for packed requests: one {id, score} entry per statement
+PACKED_SCHEMA = {
+    "name": "ces_scores",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer"},
+                        "score": {"type": "integer", "enum": [1, 2, 3, 4, 5]},
+                    },
+                    "required": ["id", "score"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["scores"],
+        "additionalProperties": False,
+    },
+}
 
-    response = client.chat.completions.create(
-        model=model,
-        temperature=temperature,
-        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": f"{content}"}],
-        max_completion_tokens=max_tokens
-    )
-    return [i, content, j, response.choices[0].message.content.strip()]
 
+def parse_packed_scores(text: str, ids: list[int]) -> dict:
+    """
+    Validate a packed answer and return {id: score} for every statement answered correctly.
+    Entries with unknown or duplicate ids and scores outside 1-5 are dropped, malformed JSON yields {}.
+    """
+    try:
+        entries = json.loads(text)["scores"]
+    except (ValueError, TypeError, KeyError):
+        return {}
+    if not isinstance(entries, list):
+        return {}
 
-def get_response_gemini(content: str, i: int, j: int, model="", max_output_token=256, temperature=1):
-    response = client_gemini.generate_content(content)
-    return [i, content, j, response.text.strip()]
+    expected = set(ids)
+    scores, seen = {}, set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        qid, score = entry.get("id"), entry.get("score")
+        if type(qid) is not int or type(score) is not int or qid not in expected or not 1 <= score <= 5:
+            continue
+        if qid in seen:
+            scores.pop(qid, None)   # answered twice, re-ask on its own
+            continue
+        seen.add(qid)
+        scores[qid] = score
+    return scores
 
 
-def get_response_claude(content: str, i: int, j: int, model="claude-3-5-sonnet-20240620", max_token=1024, temperature=1):
-    response = client_claude.message.create(
+# GPT/Grok/Together: several statements in one request
+def get_response_packed(items: list[tuple[int, str]], j: int, model="gpt-4o-mini", max_tokens=None, temperature=1) -> list:
+    """
+    Score K statements with one structured-output request.
+
+    Parameters:
+    items (list): (question number, statement) pairs
+    j (int): iteration
+
+    Returns:
+    list: one [i, statement, j, response] row per statement, statements with a missing or invalid
+        score in the packed answer are asked again with a single get_response_t request
+    """
+    content = "\n".join(f"{i}. {q}" for i, q in items)
+    ids = [i for i, _ in items]
+    try:
+        start = time.perf_counter()
+        response, endpoint = route(model, lambda client, name: client.chat.completions.create(
+            model=name,
+            temperature=temperature,
+            messages=build_messages(content, SYSTEM_PROMPT_PACKED),
+            response_format={"type": "json_schema", "json_schema": PACKED_SCHEMA},
+            max_completion_tokens=max_tokens or 20 + 15 * len(items),
+        ))
+        record_openai_usage(response, time.perf_counter() - start)
+        scores = parse_packed_scores(response.choices[0].message.content, ids)
+    except Exception as e:
+        if "rate limit" in str(e).lower() or "token limit" in str(e).lower():
+            raise
+        scores, endpoint = {}, None
+
+    rows = []
+    for i, q in items:
+        if i in scores:
+            rows.append(with_endpoint([i, q, j, str(scores[i])], endpoint))
+        else:
+            usage.add(fallback_items=1)
+            rows.append(get_response_t(q, i, j, model, temperature=temperature))
+    return rows
+
+
+def get_response_gemini(content: str, i: int, j: int, model="", max_output_token=256, temperature=1, constrained=False):
+    generation_config = None
+    if constrained:
+        # Gemini has no logit bias, only the one-token cap applies
+        generation_config = {"max_output_tokens": 1}
+        usage.add(unconstrained_requests=1)
+
+    start = time.perf_counter()
+    response = client_gemini.generate_content(
+        content, generation_config=generation_config, request_options={"timeout": REQUEST_TIMEOUT}
+    )
+    elapsed = time.perf_counter() - start
+    meta = getattr(response, "usage_metadata", None)
+    if meta is not None:
+        usage.add(
+            requests=1,
+            request_seconds=elapsed,
+            input_tokens=meta.prompt_token_count,
+            cached_input_tokens=getattr(meta, "cached_content_token_count", 0),
+            output_tokens=meta.candidates_token_count,
+        )
+    else:
+        usage.add(requests=1, request_seconds=elapsed)
+    answer = response.text.strip()
+    if constrained:
+        answer = check_score(answer)
+    return [i, content, j, answer]
+
+
+def get_response_claude(content: str, i: int, j: int, model="claude-3-5-sonnet-20240620", max_token=1024, temperature=1, system_prompt=SYSTEM_PROMPT, constrained=False):
+    if constrained:
+        # Anthropic has no logit bias, only the one-token cap applies
+        max_token = 1
+        usage.add(unconstrained_requests=1)
+
+    # the system prompt is marked as a cache breakpoint so repeated requests read it from the prompt cache
+    # (Anthropic only caches prefixes above a minimum length, 1024 tokens for Sonnet, shorter ones are billed normally)
+    start = time.perf_counter()
+    response = client_claude.beta.prompt_caching.messages.create(
         model=model,
-        system=SYSTEM_PROMPT,
-        maxtokens=max_token,
+        system=[{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}],
+        max_tokens=max_token,
         messages=[{"role": "user", "content": content}],
         temperature=temperature
     )
-    return [i, content, j, response.content.strip()]
+    elapsed = time.perf_counter() - start
+    u = response.usage
+    cache_read = u.cache_read_input_tokens or 0
+    cache_write = u.cache_creation_input_tokens or 0
+    usage.add(
+        requests=1,
+        request_seconds=elapsed,
+        input_tokens=u.input_tokens + cache_read + cache_write,
+        cached_input_tokens=cache_read,
+        cache_write_tokens=cache_write,
+        output_tokens=u.output_tokens,
+    )
+    answer = response.content[0].text.strip()
+    if constrained:
+        answer = check_score(answer)
+    return [i, content, j, answer]
+
+
+# local CPU inference: open-weight models run in this process, torch and transformers are imported on first use
+_local_models = {}
+_local_lock = threading.Lock()
+
+
+def register_local_model(name: str, tokenizer, model):
+    """Make an already loaded tokenizer/model available as `name` (e.g. a tiny randomly initialized model)."""
+    tokenizer.padding_side = "left"     # the next-token logits are then at the last position of every row
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model.eval()
+    with _local_lock:
+        _local_models[name] = (tokenizer, model)
+
+
+def load_local_model(name: str) -> tuple:
+    with _local_lock:
+        if name in _local_models:
+            return _local_models[name]
+    try:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+    except ImportError as e:
+        raise ImportError("The local backend needs torch and transformers: pip install torch transformers") from e
+
+    register_local_model(
+        name, AutoTokenizer.from_pretrained(name), AutoModelForCausalLM.from_pretrained(name, torch_dtype=torch.float32)
+    )
+    return _local_models[name]
+
+
+def local_prompt(tokenizer, content: str, system_prompt: str = SYSTEM_PROMPT) -> str:
+    # the model's chat template if it has one, the answer is the next token after the prompt
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template(
+            build_messages(content, system_prompt), tokenize=False, add_generation_prompt=True
+        )
+    return f"{system_prompt.strip()}\n\n{content}\n"
+
+
+def local_digit_ids(tokenizer) -> list:
+    # token ids of the answers "1"-"5" (the last piece, for tokenizers that prepend a word boundary marker)
+    return [tokenizer.encode(d, add_special_tokens=False)[-1] for d in VALID_SCORES]
+
+
+def score_local(contents: list[str], model: str, system_prompt: str = SYSTEM_PROMPT,
+                batch_size: int = None) -> np.ndarray:
+    """
+    Log-probabilities of the answers 1-5 as the next token after every prompt, in batched forward passes
+    of `batch_size` (default LOCAL_BATCH_SIZE) statements.
+
+    Returns:
+    np.ndarray: (statements x 5) log-probabilities over the whole vocabulary (rows sum to at most 1 in probability)
+    """
+    import torch
+
+    # here rather than when loading, so registered (pre-loaded) models use LOCAL_THREADS as well
+    if LOCAL_THREADS:
+        torch.set_num_threads(LOCAL_THREADS)
+    batch_size = batch_size or LOCAL_BATCH_SIZE
+    tokenizer, lm = load_local_model(model)
+    digit_ids = local_digit_ids(tokenizer)
+    prompts = [local_prompt(tokenizer, c, system_prompt) for c in contents]
+
+    log_probs = []
+    for k in range(0, len(prompts), batch_size):
+        start = time.perf_counter()
+        enc = tokenizer(prompts[k:k + batch_size], return_tensors="pt", padding=True)
+        # positions count from the first real token, left padding would shift them otherwise
+        positions = (enc["attention_mask"].cumsum(-1) - 1).clamp(min=0)
+        with torch.inference_mode():
+            logits = lm(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"], position_ids=positions).logits
+        batch = torch.log_softmax(logits[:, -1, :].float(), dim=-1)[:, digit_ids]
+        log_probs.append(batch.numpy())
+        usage.add(
+            requests=1,
+            request_seconds=time.perf_counter() - start,
+            input_tokens=int(enc["attention_mask"].sum()),
+        )
+    return np.vstack(log_probs)
+
+
+def sample_scores(log_probs: np.ndarray, counts: list[int], temperature: float = 1, rng=None) -> list:
+    """
+    Draw answers 1-5 from the digit distributions, like sampling one answer token with logit_bias on the digits.
+
+    Returns:
+    list: one array of score indices (0-4) per statement, counts[k] answers for statement k
+    """
+    rng = rng or np.random.default_rng()
+    draws = []
+    for row, n in zip(log_probs, counts):
+        if temperature == 0:
+            draws.append(np.full(n, int(np.argmax(row))))
+            continue
+        p = np.exp((row - row.max()) / temperature)
+        draws.append(rng.choice(len(VALID_SCORES), size=n, p=p / p.sum()))
+    return draws
+
+
+def get_response_local(items: list[tuple[int, str]], num_itr: int, model: str, temperature=1,
+                       system_prompt=SYSTEM_PROMPT, plan: dict = None, seed=None, batch_size: int = None) -> list:
+    """
+    Answer every statement num_itr times (or as often as `plan` says) with a local model.
+
+    One forward pass per batch of statements gives each statement's answer distribution, the iterations
+    are drawn from it, so a whole run costs len(items) / LOCAL_BATCH_SIZE forward passes.
+
+    Returns:
+    list: [#, statement, iteration, score] rows, like the API backends
+    """
+    plan = plan or {}
+    log_probs = score_local([q for _, q in items], model, system_prompt, batch_size)
+    counts = [plan.get(i, num_itr) for i, _ in items]
 
+    rows = []
+    for (i, q), draws in zip(items, sample_scores(log_probs, counts, temperature, np.random.default_rng(seed))):
+        rows.extend([i, q, j, VALID_SCORES[s]] for j, s in enumerate(draws))
+    return rows
@@ -1,23 +1,51 @@
+"""
+CES evaluation of an LLM in three stages, each of which can run on its own from the stored data:
+
+    collect   ask the model, write raw_data/<prefix>_raw_data.csv and usage/<prefix>_usage.json
+    analyze   averages/<prefix>_averages.csv and the graphs in plots/<prefix>/ from the raw data
+    report    reports/<prefix>_..._evaluation_report.pdf from the averages and graphs
+
+Usage (from the repository root):
+    python src/main.py <model> <llm> <prefix>             all stages (same as `run`)
+    python src/main.py local Qwen/Qwen2.5-0.5B-Instruct <prefix>    on the CPU (needs torch and transformers)
+    python src/main.py collect <model> <llm> <prefix>
+    python src/main.py analyze <prefix>
+    python src/main.py report <prefix> [--no-open]
+
+Every stage imports only what it needs: analyze and report never load the LLM SDKs or create API clients,
+and report does not load matplotlib.
+"""
 import re
+import csv
+import glob
+import json
+import os
 import concurrent.futures
 import time
 import random
 
-import matplotlib.pyplot as plt
-import pandas as pd
-
 from config.configuration import (
     PATH_TO_QUESTIONS,
     PATH_TO_CONTEMP_QUESTIONS,
     DATA_FOLDER_PATH,
+    REQUEST_TIMEOUT,
 )
-from llm_client import get_response_t, get_response_gemini
-from plotting_helper import make_graphs, make_heatmap
-from report_helper import create_pdf_report
+from executor_helper import run_hedged, get_tracker, MAX_IN_FLIGHT, HEDGE_QUANTILE
+from questionnaire import load_questionnaire
 
 NUM_ITR = 100
 MAX_RETRIES = 3
+PACK_SIZE = 1   # statements per request, >1 packs several statements into one structured-output request
+CONSTRAINED = False     # cap answers to one token restricted to the digits 1-5 where the provider allows it
+ITERATION_PLAN = None   # plan name/path from iteration_planner.py, iterations per question instead of NUM_ITR
+DEADLINE = REQUEST_TIMEOUT  # seconds a call may run before it is given up (its row is left out)
+HEDGE_BUDGET = 0.0      # extra requests hedging may add, as a share of all calls (e.g. 0.05), 0 disables it
+STREAM = None   # "abort"/"collect": stream score-first (reasoning prompt) answers, take the score as soon as it arrives
+TRACK_DRIFT = False     # append every collected run to the drift series named PREFIX (see drift_tracker.py)
 PREFIX = ""
+RAW_COLUMNS = ["#", "Question", "Iteration", "Response"]
+ENDPOINT_COLUMN = "Endpoint"    # rows of routed models name their serving endpoint (see endpoint_router.py)
+STAGES = ("run", "collect", "analyze", "report")
 
 
 def get_questions(path: str, regex: str) -> list[str]:
@@ -36,10 +64,15 @@ def run_eval(llm: str, question: str):
 
 
 def choose_llm(model: str) -> callable:
+    # imported here so the offline pipeline does not need API clients/keys
+    from llm_client import get_response_t, get_response_gemini, get_response_claude
+
     choice = {
         "gpt": get_response_t,
         "gemini": get_response_gemini,
         "grok": get_response_t,
+        "together": get_response_t,
+        "claude": get_response_claude,
     }
     try:
         return choice[model]
@@ -50,28 +83,100 @@ def choose_llm(model: str) -> callable:
         )
 
 
-def evaluate_CES(model: str, llm: str) -> list:
-    regex = r"^\d+\.\s+(.+)$"
-    ces_questions = get_questions(PATH_TO_QUESTIONS, regex)
-    contemp_questions = get_questions(PATH_TO_CONTEMP_QUESTIONS, regex)
+def choose_packed_llm(model: str) -> callable:
+    from llm_client import get_response_packed
+
+    # packing relies on JSON-schema structured output of the OpenAI-compatible APIs
+    if model not in ("gpt", "grok", "together"):
+        raise ValueError(
+            f"Packing (PACK_SIZE > 1) is not supported for '{model}'.\n"
+            f"Supported models are: gpt, grok, together."
+        )
+    return get_response_packed
+
+
+def choose_streaming_llm(model: str) -> callable:
+    from llm_client import get_response_stream
+
+    # streaming is implemented for the OpenAI-compatible APIs
+    if model not in ("gpt", "grok", "together"):
+        raise ValueError(
+            f"Streaming (STREAM) is not supported for '{model}'.\n"
+            f"Supported models are: gpt, grok, together."
+        )
+    return get_response_stream
+
+
+def make_tasks(index, num_itr: int = None, plan: dict = None):
+    # (question number, statement, iteration) of every single-statement request of a run, generated lazily
+    # plan: {question number: iterations}, questions it does not list get num_itr
+    num_itr = num_itr or NUM_ITR
+    plan = plan or {}
+    for i, q in zip(index.ids.tolist(), index.questions()):
+        for j in range(plan.get(i, num_itr)):
+            yield i, q, j
 
-    # Decide which questions set to use
-    questions = ces_questions
+
+def make_chunks(index, pack_size: int, num_itr: int = None, plan: dict = None):
+    # (statements, iteration) of every packed request, only statements that still need iteration j
+    num_itr = num_itr or NUM_ITR
+    plan = plan or {}
+    items = list(zip(index.ids.tolist(), index.questions()))
+    for j in range(max([num_itr, *plan.values()])):
+        active = [item for item in items if j < plan.get(item[0], num_itr)]
+        for k in range(0, len(active), pack_size):
+            yield active[k:k + pack_size], j
+
+
+def evaluate_CES(model: str, llm: str, pack_size: int = PACK_SIZE, constrained: bool = CONSTRAINED,
+                 plan: dict = None, deadline: float = DEADLINE, hedge_budget: float = HEDGE_BUDGET,
+                 stream: str = STREAM) -> list:
+    # Decide which questions set to use (PATH_TO_QUESTIONS or PATH_TO_CONTEMP_QUESTIONS)
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+
+    if model == "local":
+        return evaluate_local(index, llm, pack_size, plan, stream)
 
     data_list = []
     retries = 0
     get_response = choose_llm(model)
+    if pack_size > 1 and constrained:
+        raise ValueError("Packing (PACK_SIZE > 1) and the constrained answer mode cannot be combined.")
+    if stream and (pack_size > 1 or constrained):
+        raise ValueError("Streaming (STREAM) cannot be combined with packing or the constrained answer mode.")
+    if pack_size > 1:
+        get_packed = choose_packed_llm(model)
+    if stream:
+        get_response = choose_streaming_llm(model)
+    from llm_client import usage
+    usage.reset()
     while retries <= MAX_RETRIES:
+        # one thread per call in flight, so stragglers and given-up calls do not hold up the others
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT)
         try:
-            futures = []
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                for i, q in enumerate(questions, 1):
-                    for j in range(NUM_ITR):
-                        futures.append(executor.submit(get_response, q, i, j, llm))
-
-                # automatic collection of results as they finish
-                for future in concurrent.futures.as_completed(futures):
-                    data_list.append(future.result())
+            if pack_size > 1:
+                calls = ((get_packed, (chunk, j, llm), {}) for chunk, j in make_chunks(index, pack_size, plan=plan))
+            else:
+                options = {"on_score": stream} if stream else {"constrained": constrained}
+                calls = ((get_response, (q, i, j, llm), options) for i, q, j in make_tasks(index, plan=plan))
+
+            # requests are submitted lazily, at most MAX_IN_FLIGHT at a time, and collected as they finish,
+            # calls slower than the provider's p95 latency are hedged within the budget
+            stats = {}
+            results = run_hedged(
+                executor, calls, MAX_IN_FLIGHT, deadline, get_tracker(model), HEDGE_QUANTILE, hedge_budget, stats
+            )
+            try:
+                for result in results:
+                    if pack_size > 1:
+                        data_list.extend(result)
+                    else:
+                        data_list.append(result)
+            finally:
+                usage.add(hedged_requests=stats.get("hedged"), hedge_wins=stats.get("hedge_wins"),
+                          timed_out_requests=stats.get("timed_out"))
+            if stats["timed_out"]:
+                print(f"\t{stats['timed_out']} calls timed out after {deadline}s")
 
             # if successful, break out of retry loop
             break
@@ -89,21 +194,66 @@ def evaluate_CES(model: str, llm: str) -> list:
                 time.sleep(2 * (1 + random.random()) ** retries)
             else:
                 print(f"Unexpected error: {e}")
-                print(f"i={i}, j={j}, q={q}")
                 break
+        finally:
+            # given-up and losing attempts are not waited for, they end with their client's REQUEST_TIMEOUT
+            executor.shutdown(wait=False, cancel_futures=True)
 
     data_list = sorted(data_list, key=lambda x: (x[0], x[2]))
     return data_list
 
 
+def evaluate_local(index, llm: str, pack_size: int = PACK_SIZE, plan: dict = None, stream: str = STREAM) -> list:
+    """
+    Run the questionnaire on a local open-weight model (llm = Hugging Face model name or path) on the CPU.
+
+    Every statement needs one forward pass, batched LOCAL_BATCH_SIZE at a time, and the iterations are drawn
+    from its answer distribution over 1-5, so the answers are always valid and CONSTRAINED makes no difference.
+    """
+    if pack_size > 1 or stream:
+        raise ValueError("The local backend scores statements one by one, without packing (PACK_SIZE) or streaming.")
+    from llm_client import get_response_local, usage
+
+    usage.reset()
+    items = list(zip(index.ids.tolist(), index.questions()))
+    data_list = get_response_local(items, NUM_ITR, llm, plan=plan)
+    return sorted(data_list, key=lambda x: (x[0], x[2]))
+
+
+def raw_columns(data_list: list) -> list:
+    return RAW_COLUMNS + [ENDPOINT_COLUMN] if any(len(row) > len(RAW_COLUMNS) for row in data_list) else RAW_COLUMNS
+
+
+def save_raw(data_list: list) -> str:
+    # raw rows as CSV, written with the csv module so collecting does not need pandas
+    path = f"{DATA_FOLDER_PATH}/raw_data/{PREFIX}_raw_data.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        columns = raw_columns(data_list)
+        writer.writerow(columns)
+        # rows the fallback client answered get an empty endpoint cell
+        writer.writerows(row + [""] * (len(columns) - len(row)) for row in data_list)
+    return path
+
+
 def get_data(data_list: list) -> list:
+    import pandas as pd
+
     # save raw data to csv
-    df = pd.DataFrame(data_list, columns=["#", "Question", "Iteration", "Response"])
+    df = pd.DataFrame(data_list, columns=raw_columns(data_list))
     df.to_csv(f"{DATA_FOLDER_PATH}/raw_data/{PREFIX}_raw_data.csv", index=False)
     # df.to_csv(f"{DATA_FOLDER_PATH}/raw_data/TEST_raw_data.csv", index=False)
+    return analyze_data(df)
+
 
-    # process data 
-    df["Response"] = df["Response"].astype(int)
+def analyze_data(df) -> tuple:
+    import pandas as pd
+    from plotting_helper import make_graphs, make_heatmap
+
+    # process data (answers that are not a number are left out of the statistics)
+    df["Response"] = pd.to_numeric(df["Response"], errors="coerce")
+    if invalid := df["Response"].isna().sum():
+        print(f"\t{invalid} non-numeric responses ignored")
     avgs = pd.DataFrame(df.groupby("#")["Response"].mean())
     avgs.rename({"Response": "Average"}, axis=1, inplace=True)
     avgs["std"] = df.groupby("#")["Response"].std()
@@ -122,9 +272,10 @@ def get_data(data_list: list) -> list:
     graphs = graphs.drop(graphs.columns[0], axis=1) # remove index col added by merge
     graphs.index += 1
 
-    # questionnaire slices according to categories (active, passive, etc.)
-    slices = [slice(0, 5), slice(5, 11), slice(11, 16), slice(16, 21), slice(21, 23), slice(23, 27), slice(27, None)]
-    labels = ["active", "passive", "questionable", "no harm", "downloading", "recycling", "doing good"]
+    # question positions per category (active, passive, etc.) from the questionnaire headings
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    slices = index.positions()
+    labels = index.labels
 
     # calculating errors for error bars (standard deviation)
     errors = pd.DataFrame(0, index=graphs.index, columns=graphs.columns)
@@ -139,33 +290,166 @@ def get_data(data_list: list) -> list:
     return avgs, images
 
 
-if __name__ == "__main__":
-    import sys
+def save_graphs(images: list) -> list:
+    # graphs of the analyze stage, numbered in report order
+    import matplotlib.pyplot as plt
+    from plotting_helper import save_figure
 
-    if len(sys.argv) != 4:
-        print("Usage: python main.py <model> <llm> <suffix>")
-        sys.exit(1)
+    folder = f"{DATA_FOLDER_PATH}/plots/{PREFIX}"
+    os.makedirs(folder, exist_ok=True)
+    for old in glob.glob(f"{folder}/graph_*.png"):
+        os.remove(old)
+    paths = []
+    for i, fig in enumerate(images, 1):
+        paths.append(f"{folder}/graph_{i:02d}.png")
+        save_figure(fig, paths[-1])
+        plt.close(fig)
+    return paths
 
+
+def match_reasoning(rows: list, data_list: list) -> list:
     """
-    model: str
-        general model to use for generation, eg. gpt, gemini
-    llm: str
-        specific language model to use eg. gpt-4o-mini, gemini-1.5-flash
-    SUFFIX: str
-        suffix to append to the output file
-    """
-    model = sys.argv[1]
-    llm = sys.argv[2]
-    PREFIX = sys.argv[3]
+    One reasoning row per raw row that was kept.
 
+    Hedged duplicates and calls given up at their deadline stream reasoning as well, only the reasoning
+    of the attempt whose score is in the raw data is kept (a complete one if there are several).
+    """
+    kept = {(row[0], row[2]): row[3] for row in data_list}
+    matched = {}
+    for row in rows:
+        key = (row[0], row[1])
+        if kept.get(key) != row[2]:
+            continue
+        if key not in matched or (row[4] and not matched[key][4]):
+            matched[key] = row
+    return sorted(matched.values(), key=lambda row: (row[0], row[1]))
+
+
+def save_reasoning(rows: list) -> str:
+    # reasoning that followed the scores of a streamed run (STREAM = "collect"), Complete is 0 if its stream broke
+    os.makedirs(f"{DATA_FOLDER_PATH}/reasoning", exist_ok=True)
+    path = f"{DATA_FOLDER_PATH}/reasoning/{PREFIX}_reasoning.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["#", "Iteration", "Response", "Reasoning", "Complete"])
+        writer.writerows(rows)
+    return path
+
+
+def track_drift(raw_path: str):
+    from drift_tracker import add_run
+
+    result = add_run(PREFIX, raw_path)
+    if "skipped" in result:
+        return
+    drifting = ", ".join(result["drifting_categories"]) or "none"
+    print(f"\tDrift vs. the last {result['window_runs']} runs: {result['drifting_questions']} questions, "
+          f"categories: {drifting} (chart: python src/drift_tracker.py chart {PREFIX})")
+
+
+def load_usage() -> dict:
+    path = f"{DATA_FOLDER_PATH}/usage/{PREFIX}_usage.json"
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def collect(model: str, llm: str) -> tuple:
     print("Starting evaluation...")
-    data_list = evaluate_CES(model, llm)
+    plan = None
+    if ITERATION_PLAN:
+        from iteration_planner import load_plan
+        plan = load_plan(ITERATION_PLAN)
+        print(f"\tUsing iteration plan {ITERATION_PLAN} ({sum(plan.values())} calls)")
+    data_list = evaluate_CES(model, llm, plan=plan)
+    from llm_client import usage, reasoning
+    from endpoint_router import routing_snapshot
+    if STREAM == "collect":
+        print(f"\tReasoning saved to {save_reasoning(match_reasoning(reasoning.drain(), data_list))}")
+    # model and llm are kept with the usage so the report stage can name them
+    token_usage = {"model": model, "llm": llm, **usage.snapshot()}
+    endpoints = routing_snapshot().get(llm)
+    if endpoints:
+        token_usage["endpoints"] = endpoints
+        print("\tServed by " + ", ".join(f"{name}: {e['served']}" for name, e in endpoints.items()))
+    save_usage(token_usage)
     print("\tEvaluation complete.")
+    print(f"\tInput tokens: {token_usage['input_tokens']} (cached: {token_usage['cached_input_tokens']})")
+    return data_list, token_usage
+
+
+def analyze():
+    import pandas as pd
 
     print("Processing data...")
-    averages, images = get_data(data_list)
-    print("\tData processed.")
+    df = pd.read_csv(f"{DATA_FOLDER_PATH}/raw_data/{PREFIX}_raw_data.csv")
+    averages, images = analyze_data(df)
+    paths = save_graphs(images)
+    print(f"\tData processed, {len(paths)} graphs saved to {DATA_FOLDER_PATH}/plots/{PREFIX}/")
+    return averages, paths
+
+
+def report(open_report: bool = True, model: str = None, llm: str = None):
+    import pandas as pd
+    from report_helper import create_pdf_report
 
     print("Creating PDF report...")
-    create_pdf_report(model, llm, PREFIX, averages, images)
-    print("\tPDF report created. All done.")
+    usage = load_usage()
+    model = model or (usage or {}).get("model", "unknown")
+    llm = llm or (usage or {}).get("llm", "unknown")
+    averages = pd.read_csv(f"{DATA_FOLDER_PATH}/averages/{PREFIX}_averages.csv", index_col="#")
+    averages = averages.drop(columns="std", errors="ignore")
+    images = sorted(glob.glob(f"{DATA_FOLDER_PATH}/plots/{PREFIX}/graph_*.png"))
+    create_pdf_report(model, llm, PREFIX, averages, images, open_report=open_report, usage=usage)
+    print("\tPDF report created.")
+
+
+def save_usage(usage: dict):
+    # token accounting of the run (cached vs. uncached input tokens)
+    os.makedirs(f"{DATA_FOLDER_PATH}/usage", exist_ok=True)
+    with open(f"{DATA_FOLDER_PATH}/usage/{PREFIX}_usage.json", "w") as f:
+        json.dump(usage, f, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    # the original interface `main.py <model> <llm> <prefix> [--no-open]` (no stage first) runs all stages
+    args = sys.argv[1:]
+    if args and args[0] not in STAGES and args[0] not in ("-h", "--help"):
+        args = ["run", *args]
+
+    parser = argparse.ArgumentParser(description="CES evaluation of an LLM (collect, analyze, report).")
+    sub = parser.add_subparsers(dest="stage", required=True)
+    for stage in ("run", "collect"):
+        p = sub.add_parser(stage, help="all stages" if stage == "run" else "ask the model and store the raw data")
+        # model: general model to use for generation, eg. gpt, gemini
+        p.add_argument("model")
+        # llm: specific language model to use eg. gpt-4o-mini, gemini-1.5-flash
+        p.add_argument("llm")
+        # prefix of the output files
+        p.add_argument("prefix")
+        if stage == "run":
+            p.add_argument("--no-open", action="store_true", help="do not open the PDF report")
+    p = sub.add_parser("analyze", help="averages and graphs from the stored raw data")
+    p.add_argument("prefix")
+    p = sub.add_parser("report", help="PDF report from the stored averages and graphs")
+    p.add_argument("prefix")
+    p.add_argument("--model", default=None, help="model named in the report (default: from the stored usage)")
+    p.add_argument("--llm", default=None)
+    p.add_argument("--no-open", action="store_true", help="do not open the PDF report")
+    args = parser.parse_args(args)
+
+    PREFIX = args.prefix
+    if args.stage in ("run", "collect"):
+        data_list, _ = collect(args.model, args.llm)
+        raw_path = save_raw(data_list)
+        if TRACK_DRIFT:
+            track_drift(raw_path)
+    if args.stage in ("run", "analyze"):
+        analyze()
+    if args.stage in ("run", "report"):
+        report(not args.no_open, getattr(args, "model", None), getattr(args, "llm", None))
+    print("All done.")
@@ -1,9 +1,17 @@
+import io
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from PIL import Image
 
 
 YLIM = (0, 5.9)
+SCORES = np.arange(1, 6)
+HEATMAP_MODE = "auto"   # "raw" (iteration x question), "frequency" (question x score) or "binned" (iteration bins)
+MAX_RAW_ITERATIONS = 100    # "auto" draws the raw heatmap up to this many iterations, the frequency heatmap above
+HEATMAP_BINS = 20
 
 
 def make_graphs(
@@ -37,10 +45,96 @@ def make_graphs(
     return images
 
 
-def make_heatmap(df: pd.DataFrame, prefix: str) -> plt.Figure:
+def make_heatmap(df: pd.DataFrame, prefix: str, mode: str = HEATMAP_MODE) -> plt.Figure:
+    if mode == "auto":
+        mode = "raw" if df["Iteration"].max() < MAX_RAW_ITERATIONS else "frequency"
+    if mode == "frequency":
+        question_ids, counts = score_frequencies(df)
+        return make_frequency_heatmap(counts, question_ids, prefix)
+    if mode == "binned":
+        return make_binned_heatmap(df, prefix)
+
     fig, ax = plt.subplots()
     pivot_table = df.pivot_table(values="Response", index="Iteration", columns="#")
     sns.heatmap(pivot_table, cmap="viridis", cbar_kws={"label": "Responses"}, ax=ax)
     ax.set_title(f"{prefix} Heatmap")
     fig.tight_layout()
     return fig
+
+
+def _codes(df: pd.DataFrame) -> tuple:
+    # question numbers, position of every row's question and its numeric response (NaN if not a number)
+    question_ids, pos = np.unique(df["#"].to_numpy(), return_inverse=True)
+    response = pd.to_numeric(df["Response"], errors="coerce").to_numpy(dtype=float)
+    return question_ids, pos, response
+
+
+def score_frequencies(df: pd.DataFrame) -> tuple:
+    """
+    Count how often every score 1-5 was given to every question in one pass over the raw rows.
+
+    Returns:
+    tuple: question numbers and a (questions x 5) count matrix
+    """
+    question_ids, pos, response = _codes(df)
+    keep = np.isin(response, SCORES)
+    flat = pos[keep] * len(SCORES) + response[keep].astype(int) - 1
+    counts = np.bincount(flat, minlength=len(question_ids) * len(SCORES))
+    return question_ids, counts.reshape(len(question_ids), len(SCORES))
+
+
+def make_frequency_heatmap(counts: np.ndarray, question_ids, prefix: str) -> plt.Figure:
+    """
+    Heatmap of the share of each score per question from a (questions x 5) count matrix
+    (e.g. score_frequencies or ResponseTensor.score_counts), so its size does not depend on the iterations.
+    """
+    counts = np.asarray(counts, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = counts / counts.sum(axis=1, keepdims=True)
+
+    fig, ax = plt.subplots(figsize=(6, 8))
+    im = ax.imshow(shares, cmap="viridis", vmin=0, vmax=1, aspect="auto", interpolation="nearest")
+    fig.colorbar(im, ax=ax, label="Share of responses")
+    ax.set_xticks(range(len(SCORES)), SCORES)
+    ax.set_yticks(range(len(question_ids)), question_ids)
+    ax.set_xlabel("Score")
+    ax.set_ylabel("#")
+    ax.set_title(f"{prefix} Score Frequencies (n={int(counts.sum())})")
+    fig.tight_layout()
+    return fig
+
+
+def make_binned_heatmap(df: pd.DataFrame, prefix: str, bins: int = HEATMAP_BINS) -> plt.Figure:
+    """Mean response per (iteration bin x question), at most `bins` rows however many iterations there are."""
+    question_ids, pos, response = _codes(df)
+    iteration = df["Iteration"].to_numpy()
+    num_itr = int(iteration.max()) + 1
+    bins = min(bins, num_itr)
+    row = iteration * bins // num_itr
+    keep = np.isin(response, SCORES)
+
+    flat = row[keep] * len(question_ids) + pos[keep]
+    size = bins * len(question_ids)
+    sums = np.bincount(flat, weights=response[keep], minlength=size)
+    n = np.bincount(flat, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums / n).reshape(bins, len(question_ids))
+
+    fig, ax = plt.subplots()
+    im = ax.imshow(means, cmap="viridis", aspect="auto", interpolation="nearest")
+    fig.colorbar(im, ax=ax, label="Mean response")
+    edges = np.arange(bins) * num_itr // bins
+    ax.set_yticks(range(bins), edges)
+    ax.set_xticks(range(len(question_ids)), question_ids, fontsize=6)
+    ax.set_xlabel("#")
+    ax.set_ylabel("Iteration")
+    ax.set_title(f"{prefix} Heatmap ({num_itr} iterations in {bins} bins)")
+    fig.tight_layout()
+    return fig
+
+
+def save_figure(fig: plt.Figure, path: str, dpi: int = None):
+    # PNG without alpha channel, fpdf splits RGBA images pixel by pixel in Python (~1 s per graph)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    Image.open(buffer).convert("RGB").save(path, format="png")
@@ -0,0 +1,164 @@
+"""
+Prompt variant sweeps (persona x context x statement), generated lazily.
+
+A variant spec (JSON) defines personas and context templates, e.g. resources/misc/prompt_variants.json:
+    {
+        "personas": {"none": "", "student": "You are a university student on a tight budget."},
+        "contexts": {"plain": "{statement}", "acceptable": "How acceptable is the following behavior? {statement}"},
+        "iterations": 10
+    }
+
+Personas, contexts and statements are deduplicated by value (the first name is kept), so no prompt is asked
+twice. Every combination is rendered only when it is about to be submitted and at most `max_in_flight`
+requests are queued at a time (see executor_helper.run_bounded).
+Rows are appended to the output CSV as they arrive, so memory stays flat however many variants a spec defines.
+
+Usage (from the repository root):
+    python src/prompt_variants.py <model> <llm> <prefix> <spec.json> [--max-in-flight 64] [--dry-run]
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import random
+import time
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from executor_helper import run_bounded, MAX_IN_FLIGHT
+from questionnaire import load_questionnaire
+
+COLUMNS = ["#", "Question", "Iteration", "Response", "Persona", "Context"]
+MAX_RETRIES = 3
+DEFAULTS = {"personas": {"none": ""}, "contexts": {"plain": "{statement}"}}
+
+
+def unique_values(named: dict) -> tuple:
+    """The entries of `named` with a value not seen before, and the names of the dropped ones."""
+    unique, dropped = {}, []
+    values = set()
+    for name, value in named.items():
+        if value in values:
+            dropped.append(name)
+            continue
+        values.add(value)
+        unique[name] = value
+    return unique, dropped
+
+
+def load_spec(path: str) -> dict:
+    """
+    Read a variant spec, with duplicate personas/contexts dropped (their names are listed under "duplicates").
+
+    Raises:
+    ValueError: if a context has no {statement} placeholder
+    """
+    with open(path, "r") as f:
+        spec = json.load(f)
+    spec["duplicates"] = {}
+    # lists are allowed as well, their entries are then named by position
+    for key, default in DEFAULTS.items():
+        value = spec.get(key) or default
+        value = value if isinstance(value, dict) else {str(n): v for n, v in enumerate(value)}
+        spec[key], spec["duplicates"][key] = unique_values(value)
+    for c_id, context in spec["contexts"].items():
+        if "{statement}" not in context:
+            raise ValueError(f"Context '{c_id}' has no {{statement}} placeholder.")
+    return spec
+
+
+def render(persona: str, context: str, statement: str) -> str:
+    prompt = context.format(statement=statement)
+    return f"{persona}\n\n{prompt}" if persona else prompt
+
+
+def unique_statements(index) -> list:
+    """(question number, statement) of the questionnaire, a statement asked under several numbers only once."""
+    statements, _ = unique_values(dict(zip(index.ids.tolist(), index.questions())))
+    return list(statements.items())
+
+
+def iter_prompts(index, personas: dict, contexts: dict):
+    """Yield (question number, persona id, context id, prompt) for every combination, one at a time."""
+    for (p_id, persona), (c_id, context), (i, statement) in itertools.product(
+        personas.items(), contexts.items(), unique_statements(index)
+    ):
+        yield i, p_id, c_id, render(persona, context, statement)
+
+
+def ask(get_response, prompt: str, i: int, j: int, llm: str, persona: str, context: str, **kwargs) -> list:
+    # per-request backoff, so one rate limit does not restart the whole sweep
+    for retry in range(MAX_RETRIES + 1):
+        try:
+            row = get_response(prompt, i, j, llm, **kwargs)
+            # a routed model's serving endpoint stays the last column
+            return row[:4] + [persona, context] + row[4:]
+        except Exception as e:
+            limited = "rate limit" in str(e).lower() or "token limit" in str(e).lower()
+            if not limited or retry == MAX_RETRIES:
+                raise
+            time.sleep(2 * (1 + random.random()) ** (retry + 1))
+
+
+def iter_calls(prompts, num_itr: int, get_response, llm: str, constrained: bool = False):
+    for i, p_id, c_id, prompt in prompts:
+        for j in range(num_itr):
+            yield ask, (get_response, prompt, i, j, llm, p_id, c_id), {"constrained": constrained}
+
+
+def run_variant_sweep(model: str, llm: str, spec: dict, out_path: str, max_in_flight: int = MAX_IN_FLIGHT,
+                      num_itr: int = None, constrained: bool = False, dry_run: bool = False) -> dict:
+    """
+    Run (or with dry_run only count) all variants of a spec and stream the rows to `out_path`.
+
+    Returns:
+    dict: number of unique prompts, skipped duplicates and requests
+    """
+    index = load_questionnaire(spec.get("questionnaire", PATH_TO_QUESTIONS))
+    num_itr = num_itr or spec.get("iterations", 1)
+    personas, contexts = spec["personas"], spec["contexts"]
+    duplicates = spec.get("duplicates", {})
+    combinations = (len(personas) + len(duplicates.get("personas", []))) * \
+        (len(contexts) + len(duplicates.get("contexts", []))) * len(index.ids)
+    prompts = len(personas) * len(contexts) * len(unique_statements(index))
+    stats = {"prompts": prompts, "duplicates": combinations - prompts, "requests": 0}
+
+    if dry_run:
+        stats["requests"] = prompts * num_itr
+        return stats
+
+    from main import choose_llm, ENDPOINT_COLUMN
+    from endpoint_router import get_router
+    get_response = choose_llm(model)
+    routed = model in ("gpt", "grok", "together") and get_router(llm) is not None
+    calls = iter_calls(iter_prompts(index, personas, contexts), num_itr, get_response, llm, constrained)
+
+    with open(out_path, "w", newline="") as f, concurrent.futures.ThreadPoolExecutor() as executor:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS + [ENDPOINT_COLUMN] if routed else COLUMNS)
+        for row in run_bounded(executor, calls, max_in_flight):
+            writer.writerow(row)
+            stats["requests"] += 1
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a persona x context x statement prompt variant sweep.")
+    parser.add_argument("model")
+    parser.add_argument("llm")
+    parser.add_argument("prefix")
+    parser.add_argument("spec", help="variant spec JSON file")
+    parser.add_argument("--iterations", type=int, default=None, help="overrides the spec's iterations")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--constrained", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="only count prompts and requests")
+    args = parser.parse_args()
+
+    out_path = f"{DATA_FOLDER_PATH}/raw_data/{args.prefix}_variants_raw_data.csv"
+    stats = run_variant_sweep(
+        args.model, args.llm, load_spec(args.spec), out_path,
+        args.max_in_flight, args.iterations, args.constrained, args.dry_run,
+    )
+    print(f"{stats['prompts']} unique prompts ({stats['duplicates']} duplicates skipped), {stats['requests']} requests")
+    if not args.dry_run:
+        print(f"Rows written to {out_path}")
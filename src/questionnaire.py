@@ -0,0 +1,184 @@
+"""
+Compiled questionnaire index.
+
+Parses a questionnaire markdown file (numbered statements grouped under `###` category headings)
+once and exposes question id -> text -> category as NumPy arrays. The parsed index is cached as
+JSON under resources/data/cache and invalidated when the hash of the markdown file changes.
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from config.configuration import CACHE_FOLDER_PATH, CATEGORY_LABELS
+
+QUESTION_REGEX = r"^(\d+)\.\s+(.+)$"
+HEADING_REGEX = r"^###\s+(.+?)\s*$"
+UNCATEGORIZED = "uncategorized"
+INDEX_VERSION = 1
+
+_memo = {}
+
+
+class QuestionnaireIndex:
+    """
+    Questions of one questionnaire file together with their categories.
+
+    Attributes:
+    ids (np.ndarray): question numbers as written in the file, shape (n_questions,)
+    texts (np.ndarray): question texts (object array), shape (n_questions,)
+    category_codes (np.ndarray): index into `categories` for every question, shape (n_questions,)
+    categories (list): category headings in order of appearance
+    labels (list): short category labels (see CATEGORY_LABELS), same order as `categories`
+    """
+
+    def __init__(self, ids, texts, categories, category_codes, source="", sha256=""):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.texts = np.asarray(texts, dtype=object)
+        self.categories = list(categories)
+        self.category_codes = np.asarray(category_codes, dtype=np.int64)
+        self.labels = [CATEGORY_LABELS.get(c, c.lower()) for c in self.categories]
+        self.source = source
+        self.sha256 = sha256
+
+        # one-hot membership (n_categories x n_questions) for vectorized per-category reductions
+        self.membership = np.zeros((len(self.categories), len(self.ids)), dtype=bool)
+        self.membership[self.category_codes, np.arange(len(self.ids))] = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def questions(self) -> list[str]:
+        return self.texts.tolist()
+
+    def positions(self) -> list[np.ndarray]:
+        """Positional indices of the questions of every category, usable with `DataFrame.iloc`."""
+        return [np.flatnonzero(row) for row in self.membership]
+
+    def groups(self) -> dict:
+        """Mapping of category label to the question ids in that category."""
+        return {lbl: self.ids[row].tolist() for lbl, row in zip(self.labels, self.membership)}
+
+    def category_of(self, ids) -> np.ndarray:
+        """Category labels for the given question ids, KeyError for ids that are not in the questionnaire."""
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(self.ids, kind="stable")
+        pos = order[np.clip(np.searchsorted(self.ids[order], ids), 0, len(order) - 1)]
+        unknown = self.ids[pos] != ids
+        if unknown.any():
+            raise KeyError(f"Unknown question ids: {np.unique(ids[unknown]).tolist()}")
+        return np.asarray(self.labels, dtype=object)[self.category_codes[pos]]
+
+    def category_means(self, values: np.ndarray) -> np.ndarray:
+        """
+        Average per-question values over the questions of each category, ignoring NaNs.
+
+        Parameters:
+        values (np.ndarray): array whose last axis is the question axis (n_questions)
+
+        Returns:
+        np.ndarray: same leading axes, last axis replaced by the category axis (n_categories)
+        """
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        totals = np.where(valid, values, 0.0) @ self.membership.T
+        counts = valid.astype(float) @ self.membership.T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / counts
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "source": self.source,
+            "sha256": self.sha256,
+            "ids": self.ids.tolist(),
+            "texts": self.texts.tolist(),
+            "categories": self.categories,
+            "category_codes": self.category_codes.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuestionnaireIndex":
+        return cls(
+            data["ids"], data["texts"], data["categories"], data["category_codes"],
+            source=data.get("source", ""), sha256=data.get("sha256", ""),
+        )
+
+
+def parse_questionnaire(text: str, source: str = "", sha256: str = "") -> QuestionnaireIndex:
+    """Parse questionnaire markdown; statements before the first `###` heading are uncategorized."""
+    ids, texts, codes = [], [], []
+    categories = []
+    current = None
+
+    for line in text.splitlines():
+        if ma := re.match(HEADING_REGEX, line):
+            categories.append(ma.group(1))
+            current = len(categories) - 1
+        elif ma := re.match(QUESTION_REGEX, line):
+            if current is None:
+                categories.append(UNCATEGORIZED)
+                current = len(categories) - 1
+            ids.append(int(ma.group(1)))
+            texts.append(ma.group(2))
+            codes.append(current)
+
+    # drop headings without any statements below them
+    used = sorted(set(codes))
+    remap = {old: new for new, old in enumerate(used)}
+    categories = [categories[c] for c in used]
+    codes = [remap[c] for c in codes]
+
+    order = np.argsort(ids, kind="stable")
+    return QuestionnaireIndex(
+        np.asarray(ids)[order], np.asarray(texts, dtype=object)[order], categories, np.asarray(codes)[order],
+        source=source, sha256=sha256,
+    )
+
+
+def _cache_path(path: str) -> str:
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_FOLDER_PATH, "questionnaires", f"{name}.json")
+
+
+def load_questionnaire(path: str, use_cache: bool = True) -> QuestionnaireIndex:
+    """
+    Load the compiled index for a questionnaire file, parsing it only if the file changed.
+
+    Parameters:
+    path (str): path to the questionnaire markdown file
+    use_cache (bool): read/write the on-disk cache in resources/data/cache
+
+    Returns:
+    QuestionnaireIndex: the compiled index
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    sha256 = hashlib.sha256(raw).hexdigest()
+
+    key = (os.path.abspath(path), sha256)
+    if key in _memo:
+        return _memo[key]
+
+    index = None
+    cache_path = _cache_path(path)
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r") as f:
+                data = json.load(f)
+            if data.get("sha256") == sha256 and data.get("version") == INDEX_VERSION:
+                index = QuestionnaireIndex.from_dict(data)
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = parse_questionnaire(raw.decode("utf-8"), source=path, sha256=sha256)
+        if use_cache:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w") as f:
+                json.dump(index.to_dict(), f)
+
+    _memo[key] = index
+    return index
@@ -35,7 +35,7 @@ def init_pdf() -> FPDF:
     return pdf
 
 
-def create_pdf_report(model: str, llm: str, prefix: str, data_list: pd.DataFrame, images: list):
+def create_pdf_report(model: str, llm: str, prefix: str, data_list: pd.DataFrame, images: list, open_report: bool = True, usage: dict = None):
     # Initialize the global variables
     global NAME, COUNTER
     NAME, COUNTER = load_state(prefix)
@@ -58,6 +58,17 @@ def create_pdf_report(model: str, llm: str, prefix: str, data_list: pd.DataFrame
     pdf.set_font("Times", size=12)
     pdf.cell(160, 5, f"Model: {model}      (prefix: {prefix})", ln=True)
     pdf.cell(160, 5, f"LLM: {llm}", ln=True)
+    if usage:
+        pdf.cell(160, 5, f"Requests: {usage['requests']}      Output tokens: {usage['output_tokens']}", ln=True)
+        pdf.cell(160, 5, f"Input tokens: {usage['input_tokens']} (cached: {usage['cached_input_tokens']}, uncached: {usage['uncached_input_tokens']})", ln=True)
+        pdf.cell(160, 5, f"Mean request time: {usage['mean_request_seconds']:.3f}s      Invalid answers: {usage['invalid_answers']}", ln=True)
+        if usage.get("streamed_requests"):
+            pdf.cell(160, 5, f"Mean time to score: {usage['mean_score_seconds']:.3f}s      Aborted streams: {usage['aborted_streams']}", ln=True)
+        if usage.get("hedged_requests") or usage.get("timed_out_requests"):
+            pdf.cell(160, 5, f"Hedged requests: {usage['hedged_requests']} (won: {usage['hedge_wins']})      Timed out: {usage['timed_out_requests']}", ln=True)
+        if usage.get("endpoints"):
+            served = ", ".join(f"{name} {e['served']} ({e['errors']} errors)" for name, e in usage["endpoints"].items())
+            pdf.cell(160, 5, f"Endpoints: {served}", ln=True)
     
     pdf.ln(5)
     
@@ -105,13 +116,19 @@ def create_pdf_report(model: str, llm: str, prefix: str, data_list: pd.DataFrame
     pdf.set_font("Times", 'B', 14)
     pdf.cell(160, 10, "Graphs", ln=True)
     for i, img in enumerate(images, 1):
-        img_path = f"{DATA_FOLDER_PATH}/plots/temp_graph_{i}.png"
-        img.savefig(img_path)
+        # images are figures or paths of stored graphs (main.py report)
+        if isinstance(img, str):
+            img_path = img
+        else:
+            from plotting_helper import save_figure
+            img_path = f"{DATA_FOLDER_PATH}/plots/temp_graph_{i}.png"
+            save_figure(img, img_path)
         img_width = 150
         x_position = (pdf.w - img_width) / 2  # Calculate the x position to center the image
         pdf.image(img_path, x=x_position, y=None, w=img_width)
         pdf.ln(10)
-        os.remove(img_path)  # Delete the temporary graph image
+        if not isinstance(img, str):
+            os.remove(img_path)  # Delete the temporary graph image
     
     # Save PDF
     pdf_path = f"{DATA_FOLDER_PATH}/reports/{prefix}_evaluation_report.pdf"
@@ -121,4 +138,5 @@ def create_pdf_report(model: str, llm: str, prefix: str, data_list: pd.DataFrame
     save_state(NAME, COUNTER)
     
     # Open the PDF
-    subprocess.run(["open", pdf_path], check=True)
\ No newline at end of file
+    if open_report:
+        subprocess.run(["open", pdf_path], check=True)
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Compact response tensor for analysis code.
+
+All answers of many runs are stored as one int8 array of shape (models x questions x iterations), with
+MISSING for answers that are missing or not a score 1-5, plus a JSON sidecar with the model names
+and question ids. The array is saved with np.save and memory-mapped on load, so loading
+dozens of runs costs a few hundred kilobytes and no CSV parsing, and statistics are axis reductions.
+
+Usage (from the repository root):
+    python src/response_tensor.py <name> [prefix ...]
+
+Builds resources/data/tensors/<name>.npy/.json from resources/data/raw_data/<prefix>_raw_data.csv
+(all stored runs matching the CES questionnaire if no prefixes are given).
+"""
+import glob
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config.configuration import DATA_FOLDER_PATH, PATH_TO_QUESTIONS
+from questionnaire import load_questionnaire, QuestionnaireIndex
+
+MISSING = -1
+SCORES = np.arange(1, 6)
+TENSOR_FOLDER_PATH = os.path.join(DATA_FOLDER_PATH, "tensors")
+
+# column names of raw data files written by earlier versions of main.py
+LEGACY_COLUMNS = {"Questions": "Question", "Iterations": "Iteration", "Answers": "Response"}
+
+
+class ResponseTensor:
+    """
+    Responses of several runs to one questionnaire.
+
+    Attributes:
+    data (np.ndarray): int8 array (models x questions x iterations), MISSING where there is no valid answer
+    models (list): run names, one per entry of the first axis
+    question_ids (np.ndarray): question numbers along the second axis
+    meta (dict): sidecar metadata (questionnaire and its hash, shape, ...)
+    """
+
+    def __init__(self, data: np.ndarray, models: list, question_ids, meta: dict = None):
+        self.data = data
+        self.models = list(models)
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.meta = meta or {}
+
+    @property
+    def shape(self) -> tuple:
+        return self.data.shape
+
+    def model(self, name: str) -> np.ndarray:
+        """(questions x iterations) answers of one run."""
+        return self.data[self.models.index(name)]
+
+    def valid(self) -> np.ndarray:
+        return self.data != MISSING
+
+    def counts(self) -> np.ndarray:
+        """Number of valid answers per (model, question)."""
+        return self.valid().sum(axis=2)
+
+    def sums(self) -> np.ndarray:
+        return np.where(self.valid(), self.data, 0).sum(axis=2, dtype=np.int64)
+
+    def means(self) -> np.ndarray:
+        """Mean answer per (model, question), NaN without valid answers."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sums() / self.counts()
+
+    def stds(self, ddof: int = 1) -> np.ndarray:
+        """Standard deviation per (model, question), ddof=1 like pandas."""
+        valid = self.valid()
+        n = valid.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sums() / n
+            sq = (np.where(valid, self.data - mean[..., None], 0.0) ** 2).sum(axis=2)
+            return np.sqrt(sq / (n - ddof))
+
+    def score_counts(self) -> np.ndarray:
+        """Frequency of every score per (model, question), shape (models x questions x 5)."""
+        return np.stack([(self.data == s).sum(axis=2) for s in SCORES], axis=-1)
+
+    def category_means(self, index: QuestionnaireIndex) -> np.ndarray:
+        """Mean of all answers in each category per model, shape (models x categories)."""
+        membership = index.membership[:, np.searchsorted(index.ids, self.question_ids)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.sums() @ membership.T) / (self.counts() @ membership.T)
+
+    def values(self, model: str, question_ids) -> np.ndarray:
+        """Valid answers of one run to the given questions, question by question (like the raw CSV order)."""
+        pos = np.searchsorted(self.question_ids, question_ids)
+        block = self.model(model)[pos]
+        return block[block != MISSING].astype(float)
+
+    def to_frame(self, model: str) -> pd.DataFrame:
+        """Raw-data layout (#, Iteration, Response) of one run, without the missing answers."""
+        block = self.model(model)
+        q, j = np.nonzero(block != MISSING)
+        return pd.DataFrame({"#": self.question_ids[q], "Iteration": j, "Response": block[q, j].astype(int)})
+
+
+def read_raw(path: str) -> pd.DataFrame:
+    """Read a raw data CSV (current or legacy column names), responses as numbers (NaN if invalid)."""
+    df = pd.read_csv(path).rename(columns=LEGACY_COLUMNS)
+    df["Response"] = pd.to_numeric(df["Response"], errors="coerce")
+    return df
+
+
+def matches_questionnaire(raw: pd.DataFrame, index: QuestionnaireIndex) -> bool:
+    if not raw["#"].isin(index.ids).all():
+        return False
+    if "Question" not in raw.columns:
+        return True
+    # the statements must be the questionnaire's (question numbers alone do not tell questionnaires apart)
+    texts = {t.strip() for t in index.questions()}
+    return raw["Question"].astype(str).str.strip().isin(texts).mean() > 0.9
+
+
+def build_tensor(runs: dict, index: QuestionnaireIndex, num_itr: int = None) -> ResponseTensor:
+    """
+    Build a response tensor from raw runs.
+
+    Parameters:
+    runs (dict): run name -> raw DataFrame (#, Iteration, Response)
+    index (QuestionnaireIndex): questionnaire the runs answered
+    num_itr (int, optional): size of the iteration axis, defaults to the longest run
+
+    Returns:
+    ResponseTensor: the combined answers
+    """
+    if num_itr is None:
+        num_itr = max((int(raw["Iteration"].max()) + 1 for raw in runs.values()), default=0)
+
+    data = np.full((len(runs), len(index.ids), num_itr), MISSING, dtype=np.int8)
+    for m, raw in enumerate(runs.values()):
+        response = raw["Response"].to_numpy(dtype=float)
+        keep = np.isin(response, SCORES) & (raw["Iteration"].to_numpy() < num_itr)
+        q = np.searchsorted(index.ids, raw["#"].to_numpy()[keep])
+        data[m, q, raw["Iteration"].to_numpy()[keep]] = response[keep].astype(np.int8)
+
+    return ResponseTensor(data, list(runs), index.ids, {
+        "questionnaire": index.source,
+        "questionnaire_sha256": index.sha256,
+    })
+
+
+def save_tensor(tensor: ResponseTensor, name: str, folder: str = TENSOR_FOLDER_PATH) -> str:
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.join(folder, name)
+    np.save(f"{stem}.npy", np.ascontiguousarray(tensor.data))
+    meta = dict(tensor.meta)
+    meta.update({
+        "models": tensor.models,
+        "question_ids": tensor.question_ids.tolist(),
+        "shape": list(tensor.shape),
+        "dtype": "int8",
+        "missing": MISSING,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    })
+    with open(f"{stem}.json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return stem
+
+
+def load_tensor(name: str, folder: str = TENSOR_FOLDER_PATH, mmap: bool = True) -> ResponseTensor:
+    """Load a saved tensor, memory-mapped (read-only) unless mmap is False."""
+    stem = name if os.path.exists(f"{name}.npy") else os.path.join(folder, name)
+    with open(f"{stem}.json", "r") as f:
+        meta = json.load(f)
+    data = np.load(f"{stem}.npy", mmap_mode="r" if mmap else None)
+    return ResponseTensor(data, meta["models"], meta["question_ids"], meta)
+
+
+def load_runs(prefixes: list = None, index: QuestionnaireIndex = None) -> dict:
+    """Read stored raw runs by prefix (all runs answering `index` if None) as run name -> DataFrame."""
+    raw_folder = os.path.join(DATA_FOLDER_PATH, "raw_data")
+    if prefixes:
+        paths = {p: os.path.join(raw_folder, f"{p}_raw_data.csv") for p in prefixes}
+    else:
+        paths = {}
+        for path in sorted(glob.glob(os.path.join(raw_folder, "*.csv"))):
+            name = os.path.basename(path).removesuffix(".csv").removesuffix("_raw_data")
+            paths[name] = path
+
+    runs = {}
+    for name, path in paths.items():
+        raw = read_raw(path)
+        if index is not None and not matches_questionnaire(raw, index):
+            if prefixes:
+                raise ValueError(f"{path} does not match the questionnaire {index.source}")
+            print(f"\tskipping {path} (different questionnaire)")
+            continue
+        runs[name] = raw
+    return runs
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python response_tensor.py <name> [prefix ...]")
+        sys.exit(1)
+
+    name, prefixes = sys.argv[1], sys.argv[2:]
+    index = load_questionnaire(PATH_TO_QUESTIONS)
+    runs = load_runs(prefixes, index)
+    tensor = build_tensor(runs, index)
+    stem = save_tensor(tensor, name)
+    print(f"Saved {len(runs)} runs as {tensor.shape} int8 tensor to {stem}.npy ({tensor.data.nbytes / 1024:.0f} KiB)")
@@ -0,0 +1,290 @@
+"""
+Local stand-in for the LLM providers, for testing the evaluation pipeline without API keys or costs.
+
+Serves OpenAI-compatible `/chat/completions` and Anthropic `/messages` requests with a random
+1-5 score and emulates provider prompt caching: the first request with a given prompt prefix
+writes it to the cache, later requests with the same prefix report it as cached input tokens.
+When the system prompt asks for reasoning, the score is followed by a reasoning text. Every word of a chat
+completion takes --token-latency to generate, streamed completions (`stream: true`) are sent word by word
+as server-sent events.
+
+Usage:
+    python src/stub_server.py --port 8000 --latency 0.05
+    LLM_BASE_URL=http://localhost:8000/v1 OPENAI_API_KEY_HfP=stub ANTHROPIC_API_KEY=stub ... python src/main.py gpt gpt-4o-mini TEST
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def count_tokens(text: str) -> int:
+    # rough estimate (~4 characters per token) is enough for emulating usage numbers
+    return max(1, len(text) // 4)
+
+
+class StubState:
+    """Prompt cache and settings shared by all request handler threads."""
+
+    def __init__(self, latency=0.0, jitter=0.0, min_cache_tokens=0, seed=None, malformed_rate=0.0, chatty_rate=0.0,
+                 slow_rate=0.0, slow_latency=0.0, token_latency=0.0, reasoning_tokens=60):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.token_latency = token_latency
+        self.reasoning_tokens = reasoning_tokens
+        self.streamed_tokens = 0
+        self.min_cache_tokens = min_cache_tokens
+        self.malformed_rate = malformed_rate
+        self.chatty_rate = chatty_rate
+        self.rng = random.Random(seed)
+        self._cache = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, prefix: str) -> bool:
+        """Return whether `prefix` was cached before and cache it now."""
+        key = hashlib.sha256(prefix.encode("utf-8")).digest()
+        with self._lock:
+            hit = key in self._cache
+            self._cache.add(key)
+        return hit
+
+    def score(self) -> str:
+        with self._lock:
+            return str(self.rng.randint(1, 5))
+
+    def malformed(self) -> bool:
+        with self._lock:
+            return self.rng.random() < self.malformed_rate
+
+    def chatty(self) -> bool:
+        with self._lock:
+            return self.rng.random() < self.chatty_rate
+
+    def wait(self):
+        with self._lock:
+            delay = self.latency + self.rng.random() * self.jitter
+            if self.rng.random() < self.slow_rate:
+                delay += self.slow_latency
+        if delay > 0:
+            time.sleep(delay)
+
+
+def text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def plain_answer(max_tokens, restricted: bool, state: StubState) -> str:
+    # a chatty model starts with a preamble unless the vocabulary is restricted to the digits,
+    # a token cap cuts the answer off after that many (word) tokens
+    score = state.score()
+    if restricted or not state.chatty():
+        return score
+    words = f"I would rate this statement a {score}.".split()
+    return " ".join(words[:max_tokens] if max_tokens else words)
+
+
+def reasoning_answer(state: StubState) -> str:
+    # score first, then a reasoning of reasoning_tokens words (SYSTEM_PROMPT_REASIONING format)
+    words = ("This behavior affects the seller and other customers in ways that are hard to justify " * 20).split()
+    return f"{state.score()}\n" + " ".join(words[:state.reasoning_tokens]) + "."
+
+
+def packed_answer(content: str, state: StubState) -> str:
+    # one score per numbered statement, optionally broken to exercise the client's validation
+    ids = [int(ma.group(1)) for ma in re.finditer(r"^(\d+)\.\s", content, re.MULTILINE)]
+    if state.malformed():
+        return '{"scores": [' + ", ".join(f'{{"id": {i}, "score": "{state.score()}"}}' for i in ids[:-1])
+    return json.dumps({"scores": [{"id": i, "score": int(state.score())} for i in ids]})
+
+
+def chat_completion(body: dict, state: StubState) -> dict:
+    messages = body.get("messages", [])
+    # OpenAI caches the longest previously seen prefix, here: all leading system messages
+    prefix = "".join(text_of(m["content"]) for m in messages if m["role"] == "system")
+    prompt_tokens = sum(count_tokens(text_of(m["content"])) for m in messages)
+    prefix_tokens = count_tokens(prefix) if prefix else 0
+
+    cached = 0
+    if prefix and prefix_tokens >= state.min_cache_tokens and state.lookup(prefix):
+        cached = prefix_tokens
+
+    if body.get("response_format", {}).get("type") == "json_schema":
+        answer = packed_answer(text_of(messages[-1]["content"]), state)
+    elif "reasoning" in prefix.lower():
+        answer = reasoning_answer(state)
+    else:
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        answer = plain_answer(max_tokens, bool(body.get("logit_bias")), state)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(answer),
+            "total_tokens": prompt_tokens + count_tokens(answer),
+            "prompt_tokens_details": {"cached_tokens": cached},
+        },
+    }
+
+
+def stream_chunks(payload: dict, include_usage: bool):
+    # chat.completion.chunk events of a completion, one per word, and a final usage event
+    base = {"id": payload["id"], "object": "chat.completion.chunk", "created": payload["created"], "model": payload["model"]}
+    words = re.findall(r"\S+\s*|\s+", payload["choices"][0]["message"]["content"])
+    for n, word in enumerate(words):
+        choice = {"index": 0, "delta": {"content": word}, "finish_reason": None}
+        if n == 0:
+            choice["delta"]["role"] = "assistant"
+        yield {**base, "choices": [choice]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if include_usage:
+        yield {**base, "choices": [], "usage": payload["usage"]}
+
+
+def anthropic_message(body: dict, state: StubState) -> dict:
+    system = body.get("system", [])
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+
+    # everything up to the last block with a cache_control marker is the cacheable prefix
+    breakpoint_at = max((n for n, b in enumerate(system) if b.get("cache_control")), default=-1)
+    prefix = "".join(b["text"] for b in system[:breakpoint_at + 1])
+    rest = "".join(b["text"] for b in system[breakpoint_at + 1:])
+    rest += "".join(text_of(m["content"]) for m in body.get("messages", []))
+
+    cache_read = cache_write = 0
+    uncached = count_tokens(rest)
+    if prefix:
+        prefix_tokens = count_tokens(prefix)
+        if prefix_tokens < state.min_cache_tokens:
+            uncached += prefix_tokens
+        elif state.lookup(prefix):
+            cache_read = prefix_tokens
+        else:
+            cache_write = prefix_tokens
+
+    answer = plain_answer(body.get("max_tokens"), False, state)
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "content": [{"type": "text", "text": answer}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": uncached,
+            "output_tokens": count_tokens(answer),
+            "cache_creation_input_tokens": cache_write,
+            "cache_read_input_tokens": cache_read,
+        },
+    }
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+
+            path = self.path.split("?")[0]
+            if path.endswith("/chat/completions"):
+                payload = chat_completion(body, state)
+            elif path.endswith("/messages"):
+                payload = anthropic_message(body, state)
+            else:
+                self.send_error(404, f"Unknown endpoint: {path}")
+                return
+
+            state.wait()
+            if body.get("stream"):
+                self.send_stream(payload, body.get("stream_options", {}).get("include_usage", False))
+                return
+            if state.token_latency and "choices" in payload:
+                time.sleep(state.token_latency * len(payload["choices"][0]["message"]["content"].split()))
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_stream(self, payload: dict, include_usage: bool):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for chunk in stream_chunks(payload, include_usage):
+                    if chunk["choices"] and chunk["choices"][0]["delta"].get("content"):
+                        with state._lock:
+                            state.streamed_tokens += 1
+                        if state.token_latency:
+                            time.sleep(state.token_latency)
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass    # the client closed the stream early
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StubServer(ThreadingHTTPServer):
+    # room for a full submission window of connections arriving at once
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=8000, state: StubState = None) -> ThreadingHTTPServer:
+    """Start the stand-in server in a background thread and return it (call `.shutdown()` to stop)."""
+    server = StubServer((host, port), make_handler(state or StubState()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in LLM server (OpenAI/Anthropic compatible).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="base delay per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="additional random delay up to this many seconds")
+    parser.add_argument("--min-cache-tokens", type=int, default=0, help="shortest prefix that is cached")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of broken structured (packed) answers")
+    parser.add_argument("--chatty-rate", type=float, default=0.0, help="share of answers with a preamble before the score")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests delayed by --slow-latency (stragglers)")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="extra delay of slow requests in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="delay per streamed token in seconds")
+    parser.add_argument("--reasoning-tokens", type=int, default=60, help="length of streamed reasoning texts")
+    args = parser.parse_args()
+
+    state = StubState(
+        args.latency, args.jitter, args.min_cache_tokens, args.seed, args.malformed_rate, args.chatty_rate,
+        args.slow_rate, args.slow_latency, args.token_latency, args.reasoning_tokens,
+    )
+    server = StubServer((args.host, args.port), make_handler(state))
+    print(f"Stub LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,428 @@
+"""
+Distributed execution of evaluation sweeps through a durable work queue.
+
+A sweep is one run of evaluate_CES (model, llm, prefix). Its (question, iteration) tasks are published
+to a queue, any number of workers on any number of processes/hosts lease tasks with a visibility timeout,
+call the LLM and store the answers in the shared results store. A task whose lease runs out (crashed or
+hung worker) is delivered again; results are keyed by task so a re-delivered task is never counted twice.
+The coordinator reports progress and runs the usual processing/report once every task is done.
+
+Queues:
+    SQLite file (default resources/data/queue.db): processes on one host or a local file system
+    redis://host:port/db: any Redis-compatible server, for workers on several hosts (needs `redis`)
+
+Usage (from the repository root):
+    python src/work_queue.py publish <model> <llm> <prefix> [--queue URL] [--constrained] [--plan NAME]
+    python src/work_queue.py worker [--queue URL] [--threads 16] [--visibility 120]
+    python src/work_queue.py coordinate <prefix> [--queue URL] [--interval 5]
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+
+from config.configuration import PATH_TO_QUESTIONS, WORK_QUEUE_PATH
+from questionnaire import load_questionnaire
+
+DEFAULT_VISIBILITY = 120.0  # seconds a leased task stays invisible to other workers
+MAX_ATTEMPTS = 5
+
+
+def decode_tail(value) -> list:
+    # results store the row after [#, question, iteration] as a JSON list (response, then e.g. the endpoint),
+    # older queues the bare response
+    try:
+        tail = json.loads(value)
+    except (TypeError, ValueError):
+        return [value]
+    return tail if isinstance(tail, list) else [value]
+
+
+class SQLiteTaskQueue:
+    """Work queue and results store in one SQLite database."""
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sweeps (
+                sweep TEXT PRIMARY KEY, model TEXT, llm TEXT, options TEXT, created REAL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sweep TEXT, q_num INTEGER, question TEXT, iteration INTEGER,
+                status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0,
+                lease_until REAL DEFAULT 0, worker TEXT, error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until);
+            CREATE TABLE IF NOT EXISTS results (
+                task_id INTEGER PRIMARY KEY, sweep TEXT, q_num INTEGER, question TEXT,
+                iteration INTEGER, response TEXT, worker TEXT, finished REAL
+            );
+        """)
+
+    def publish(self, sweep: str, model: str, llm: str, tasks: list, options: dict = None):
+        """Add a sweep and its (question number, statement, iteration) tasks."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.conn.execute("SELECT 1 FROM sweeps WHERE sweep = ?", (sweep,)).fetchone():
+                raise ValueError(f"Sweep '{sweep}' was already published.")
+            self.conn.execute(
+                "INSERT INTO sweeps VALUES (?, ?, ?, ?, ?)",
+                (sweep, model, llm, json.dumps(options or {}), time.time()),
+            )
+            self.conn.executemany(
+                "INSERT INTO tasks (sweep, q_num, question, iteration) VALUES (?, ?, ?, ?)",
+                [(sweep, i, q, j) for i, q, j in tasks],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def sweep_info(self, sweep: str) -> dict:
+        row = self.conn.execute("SELECT model, llm, options FROM sweeps WHERE sweep = ?", (sweep,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown sweep: '{sweep}'")
+        return {"model": row[0], "llm": row[1], "options": json.loads(row[2])}
+
+    def lease(self, worker: str, n: int, visibility: float = DEFAULT_VISIBILITY, sweep: str = None) -> list[dict]:
+        """Claim up to n pending tasks (or tasks whose lease expired) for `visibility` seconds."""
+        now = time.time()
+        query = (
+            "SELECT id, sweep, q_num, question, iteration FROM tasks "
+            "WHERE (status = 'pending' OR (status = 'leased' AND lease_until < ?))"
+        )
+        params = [now]
+        if sweep is not None:
+            query += " AND sweep = ?"
+            params.append(sweep)
+        query += " ORDER BY id LIMIT ?"
+        params.append(n)
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # expired leases of tasks that were delivered too often are given up
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = self.conn.execute(query, params).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', lease_until = ?, worker = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now + visibility, worker, r[0]) for r in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [dict(zip(("id", "sweep", "q_num", "question", "iteration"), r)) for r in rows]
+
+    def complete(self, task: dict, worker: str, tail: list):
+        """Store the row after [#, question, iteration] (the response and e.g. the serving endpoint) of a task."""
+        # INSERT OR IGNORE: the first delivery of a task to finish wins, re-deliveries are dropped
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (task["id"], task["sweep"], task["q_num"], task["question"], task["iteration"], json.dumps(tail), worker,
+             time.time()),
+        )
+        self.conn.execute("UPDATE tasks SET status = 'done', error = NULL WHERE id = ?", (task["id"],))
+        self.conn.execute("COMMIT")
+
+    def fail(self, task: dict, worker: str, error: str):
+        """Release a task for re-delivery, or give up on it after max_attempts deliveries."""
+        # only while this worker still holds the lease, otherwise it was delivered to someone else already
+        self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_until = 0, error = ? WHERE id = ? AND status = 'leased' AND worker = ?",
+            (self.max_attempts, error[:500], task["id"], worker),
+        )
+
+    def progress(self, sweep: str) -> dict:
+        counts = dict.fromkeys(("pending", "leased", "done", "failed"), 0)
+        for status, n in self.conn.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE sweep = ? GROUP BY status", (sweep,)
+        ):
+            counts[status] = n
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def results(self, sweep: str) -> list:
+        """Rows in the evaluate_CES format ([#, question, iteration, response(, endpoint)]), sorted like its output."""
+        rows = self.conn.execute(
+            "SELECT q_num, question, iteration, response FROM results WHERE sweep = ? ORDER BY q_num, iteration",
+            (sweep,),
+        )
+        return [[i, q, j, *decode_tail(tail)] for i, q, j, tail in rows]
+
+
+# Lua scripts keep lease/complete atomic on the Redis side
+_LEASE_SCRIPT = """
+local pending, leases, results = KEYS[1], KEYS[2], KEYS[3]
+local now, deadline, n = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', leases, '-inf', now)) do
+    redis.call('ZREM', leases, id)
+    redis.call('RPUSH', pending, id)
+end
+local ids = {}
+while #ids < n do
+    local id = redis.call('LPOP', pending)
+    if not id then break end
+    if redis.call('HEXISTS', results, id) == 0 then
+        redis.call('ZADD', leases, deadline, id)
+        table.insert(ids, id)
+    end
+end
+return ids
+"""
+
+_COMPLETE_SCRIPT = """
+local leases, results, done, failed, id, value = KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[1], ARGV[2]
+redis.call('ZREM', leases, id)
+if redis.call('HSETNX', results, id, value) == 1 then
+    redis.call('SADD', done, id)
+end
+-- a late answer to a task given up after max_attempts still completes it (like the SQLite state update)
+redis.call('SREM', failed, id)
+return 1
+"""
+
+
+class RedisTaskQueue:
+    """Same interface as SQLiteTaskQueue on a Redis-compatible server (lists, sorted sets and hashes per sweep)."""
+
+    def __init__(self, url: str, max_attempts: int = MAX_ATTEMPTS):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required for redis:// queues: pip install redis")
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.max_attempts = max_attempts
+        self._lease = self.r.register_script(_LEASE_SCRIPT)
+        self._complete = self.r.register_script(_COMPLETE_SCRIPT)
+
+    @staticmethod
+    def _key(sweep: str, name: str) -> str:
+        return f"ces:{sweep}:{name}"
+
+    def publish(self, sweep: str, model: str, llm: str, tasks: list, options: dict = None):
+        info = json.dumps({"model": model, "llm": llm, "options": options or {}})
+        if not self.r.hsetnx("ces:sweeps", sweep, info):
+            raise ValueError(f"Sweep '{sweep}' was already published.")
+        pipe = self.r.pipeline()
+        for task_id, (i, q, j) in enumerate(tasks):
+            pipe.hset(self._key(sweep, "tasks"), task_id, json.dumps([i, q, j]))
+            pipe.rpush(self._key(sweep, "pending"), task_id)
+        pipe.execute()
+
+    def sweep_info(self, sweep: str) -> dict:
+        info = self.r.hget("ces:sweeps", sweep)
+        if info is None:
+            raise KeyError(f"Unknown sweep: '{sweep}'")
+        return json.loads(info)
+
+    def lease(self, worker: str, n: int, visibility: float = DEFAULT_VISIBILITY, sweep: str = None) -> list[dict]:
+        sweeps = [sweep] if sweep is not None else list(self.r.hkeys("ces:sweeps"))
+        tasks = []
+        for s in sweeps:
+            now = time.time()
+            keys = [self._key(s, "pending"), self._key(s, "leases"), self._key(s, "results")]
+            ids = self._lease(keys=keys, args=[now, now + visibility, n - len(tasks)])
+            for task_id in ids:
+                attempts = self.r.hincrby(self._key(s, "attempts"), task_id, 1)
+                if attempts > self.max_attempts:
+                    self.r.zrem(self._key(s, "leases"), task_id)
+                    self.r.sadd(self._key(s, "failed"), task_id)
+                    continue
+                i, q, j = json.loads(self.r.hget(self._key(s, "tasks"), task_id))
+                tasks.append({"id": int(task_id), "sweep": s, "q_num": i, "question": q, "iteration": j})
+            if len(tasks) >= n:
+                break
+        return tasks
+
+    def complete(self, task: dict, worker: str, tail: list):
+        s = task["sweep"]
+        keys = [self._key(s, "leases"), self._key(s, "results"), self._key(s, "done"), self._key(s, "failed")]
+        self._complete(keys=keys, args=[task["id"], json.dumps([tail, worker, time.time()])])
+
+    def fail(self, task: dict, worker: str, error: str):
+        s = task["sweep"]
+        # only requeue while we still hold the lease, otherwise it expired and was requeued already
+        if self.r.zrem(self._key(s, "leases"), task["id"]):
+            if int(self.r.hget(self._key(s, "attempts"), task["id"]) or 0) >= self.max_attempts:
+                self.r.sadd(self._key(s, "failed"), task["id"])
+            else:
+                self.r.rpush(self._key(s, "pending"), task["id"])
+
+    def progress(self, sweep: str) -> dict:
+        pipe = self.r.pipeline()
+        pipe.hlen(self._key(sweep, "tasks"))
+        pipe.scard(self._key(sweep, "done"))
+        pipe.scard(self._key(sweep, "failed"))
+        pipe.zcard(self._key(sweep, "leases"))
+        total, done, failed, leased = pipe.execute()
+        return {
+            "pending": total - done - failed - leased,
+            "leased": leased,
+            "done": done,
+            "failed": failed,
+            "total": total,
+        }
+
+    def results(self, sweep: str) -> list:
+        tasks = self.r.hgetall(self._key(sweep, "tasks"))
+        rows = []
+        for task_id, value in self.r.hgetall(self._key(sweep, "results")).items():
+            i, q, j = json.loads(tasks[task_id])
+            tail = json.loads(value)[0]
+            rows.append([i, q, j, *(tail if isinstance(tail, list) else [tail])])
+        return sorted(rows, key=lambda x: (x[0], x[2]))
+
+
+def open_queue(url: str = None):
+    url = url or WORK_QUEUE_PATH
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTaskQueue(url)
+    return SQLiteTaskQueue(url.removeprefix("sqlite:///").removeprefix("sqlite:"))
+
+
+def publish_sweep(queue, model: str, llm: str, prefix: str, constrained: bool = False, plan: dict = None) -> int:
+    """Publish the tasks evaluate_CES would run for this model (and iteration plan) as sweep `prefix`."""
+    import main
+
+    if model not in ("gpt", "gemini", "grok", "together", "claude"):
+        raise ValueError(f"Invalid model choice: '{model}'.")
+    tasks = list(main.make_tasks(load_questionnaire(PATH_TO_QUESTIONS), plan=plan))
+    queue.publish(prefix, model, llm, tasks, {"constrained": constrained})
+    return len(tasks)
+
+
+def run_worker(queue, threads: int = 16, visibility: float = DEFAULT_VISIBILITY, sweep: str = None,
+               idle_exit: float = None, worker: str = None):
+    """
+    Lease and execute tasks until the queue stays empty for `idle_exit` seconds (forever if None).
+    Each leased batch is executed with `threads` concurrent requests.
+    """
+    from main import choose_llm
+
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    infos, retries = {}, 0
+    idle_since = time.time()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            tasks = queue.lease(worker, threads, visibility, sweep)
+            if not tasks:
+                if idle_exit is not None and time.time() - idle_since > idle_exit:
+                    return
+                time.sleep(1)
+                continue
+            idle_since = time.time()
+
+            futures = {}
+            for task in tasks:
+                if task["sweep"] not in infos:
+                    infos[task["sweep"]] = queue.sweep_info(task["sweep"])
+                info = infos[task["sweep"]]
+                get_response = choose_llm(info["model"])
+                futures[executor.submit(
+                    get_response, task["question"], task["q_num"], task["iteration"], info["llm"],
+                    constrained=info["options"].get("constrained", False),
+                )] = task
+
+            rate_limited = False
+            for future in concurrent.futures.as_completed(futures):
+                task = futures[future]
+                try:
+                    # everything after [#, question, iteration], a routed model's endpoint included
+                    queue.complete(task, worker, future.result()[3:])
+                except Exception as e:
+                    queue.fail(task, worker, str(e))
+                    if "rate limit" in str(e).lower() or "token limit" in str(e).lower():
+                        rate_limited = True
+                    else:
+                        print(f"Task {task['id']} failed: {e}")
+
+            # exponential backoff like evaluate_CES, the failed tasks are delivered again later
+            if rate_limited:
+                retries += 1
+                time.sleep(min(60, 2 * (1 + random.random()) ** retries))
+            else:
+                retries = 0
+
+
+def coordinate(queue, prefix: str, interval: float = 5.0, open_report: bool = True) -> dict:
+    """Report progress of sweep `prefix` until every task finished, then process the results and create the report."""
+    import main
+    from report_helper import create_pdf_report
+
+    info = queue.sweep_info(prefix)
+    while True:
+        progress = queue.progress(prefix)
+        print(f"\t{progress['done']}/{progress['total']} done, {progress['leased']} leased, "
+              f"{progress['pending']} pending, {progress['failed']} failed")
+        if progress["pending"] == 0 and progress["leased"] == 0:
+            break
+        time.sleep(interval)
+
+    data_list = queue.results(prefix)
+    print("Processing data...")
+    main.PREFIX = prefix
+    averages, images = main.get_data(data_list)
+    print("Creating PDF report...")
+    create_pdf_report(info["model"], info["llm"], prefix, averages, images, open_report=open_report)
+    return progress
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run CES evaluation sweeps through a shared work queue.")
+    parser.add_argument("--queue", default=None, help=f"SQLite path or redis:// URL (default: {WORK_QUEUE_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("publish", help="publish the tasks of a sweep")
+    p.add_argument("model")
+    p.add_argument("llm")
+    p.add_argument("prefix")
+    p.add_argument("--constrained", action="store_true")
+    p.add_argument("--plan", default=None, help="iteration plan from iteration_planner.py")
+
+    p = sub.add_parser("worker", help="lease and execute tasks")
+    p.add_argument("--threads", type=int, default=16)
+    p.add_argument("--visibility", type=float, default=DEFAULT_VISIBILITY)
+    p.add_argument("--sweep", default=None, help="only work on this sweep")
+    p.add_argument("--idle-exit", type=float, default=None, help="stop after this many idle seconds")
+
+    p = sub.add_parser("coordinate", help="report progress and aggregate a finished sweep")
+    p.add_argument("prefix")
+    p.add_argument("--interval", type=float, default=5.0)
+    p.add_argument("--no-open", action="store_true", help="do not open the PDF report")
+
+    args = parser.parse_args()
+    queue = open_queue(args.queue)
+
+    if args.command == "publish":
+        plan = None
+        if args.plan:
+            from iteration_planner import load_plan
+            plan = load_plan(args.plan)
+        n = publish_sweep(queue, args.model, args.llm, args.prefix, args.constrained, plan)
+        print(f"Published {n} tasks for sweep '{args.prefix}'.")
+    elif args.command == "worker":
+        run_worker(queue, args.threads, args.visibility, args.sweep, args.idle_exit)
+    elif args.command == "coordinate":
+        progress = coordinate(queue, args.prefix, args.interval, not args.no_open)
+        if progress["failed"]:
+            print(f"\t{progress['failed']} task(s) failed after {MAX_ATTEMPTS} attempts.")
+            sys.exit(1)
@@ -0,0 +1,158 @@
+"""
+Local CPU backend (llm_client.get_response_local) on tiny randomly initialized models.
+
+Skipped where torch/transformers are not installed. Run from the repository root:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# llm_client creates its API clients at import time, they are never used here
+for key in ("OPENAI_API_KEY_HfP", "ANTHROPIC_API_KEY", "TOGETHER_AI_API_KEY", "GEMINI_API_KEY", "XAI_API_KEY"):
+    os.environ.setdefault(key, "test")
+
+import llm_client  # noqa: E402
+
+WORDS = ["rate", "the", "behavior", "from", "wrong", "not", "returning", "goods", "a", "clerk", "item", "price",
+         "system", "user", "assistant", ":", ".", ","]
+STATEMENTS = [
+    (1, "returning goods"),
+    (2, "returning the goods a clerk"),
+    (3, "not wrong , the clerk , not a price"),
+    (4, "the price from a clerk , not the item price ."),
+    (5, "rate"),
+]
+CHAT_TEMPLATE = (
+    "{% for m in messages %}{{ m['role'] }} : {{ m['content'] }}\n{% endfor %}"
+    "{% if add_generation_prompt %}assistant :{% endif %}"
+)
+
+
+def word_tokenizer():
+    # BPE/GPT-2 style: digits are whole tokens
+    vocab = {t: n for n, t in enumerate(["[UNK]", "[EOS]", *llm_client.VALID_SCORES, *WORDS])}
+    tok = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="[UNK]", eos_token="[EOS]")
+
+
+def sentencepiece_tokenizer():
+    # SentencePiece/Llama style: a word boundary marker is prepended, "1" encodes as ["▁", "1"]
+    symbols = ["[UNK]", "[EOS]", "[PAD]", "▁", *llm_client.VALID_SCORES, *sorted(set("".join(WORDS)))]
+    tok = tokenizers.Tokenizer(tokenizers.models.BPE({t: n for n, t in enumerate(symbols)}, [], unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Metaspace()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok, unk_token="[UNK]", eos_token="[EOS]", pad_token="[PAD]"
+    )
+    tokenizer.chat_template = CHAT_TEMPLATE
+    return tokenizer
+
+
+def tiny_gpt2(vocab_size: int):
+    config = transformers.GPT2Config(vocab_size=vocab_size, n_positions=2048, n_embd=32, n_layer=2, n_head=2)
+    return transformers.GPT2LMHeadModel(config)
+
+
+def tiny_llama(vocab_size: int):
+    config = transformers.LlamaConfig(
+        vocab_size=vocab_size, hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=2,
+        num_key_value_heads=2, max_position_embeddings=4096,
+    )
+    return transformers.LlamaForCausalLM(config)
+
+
+@pytest.fixture(scope="module", params=["gpt2", "llama"])
+def local_model(request):
+    torch.manual_seed(0)
+    if request.param == "gpt2":
+        tokenizer = word_tokenizer()
+        model = tiny_gpt2(len(tokenizer))
+    else:
+        tokenizer = sentencepiece_tokenizer()
+        model = tiny_llama(len(tokenizer))
+    name = f"tiny-{request.param}"
+    llm_client.register_local_model(name, tokenizer, model)
+    return name
+
+
+def count_forward_passes(name: str) -> list:
+    calls = []
+    _, model = llm_client.load_local_model(name)
+    handle = model.register_forward_hook(lambda *args: calls.append(1))
+    return calls, handle
+
+
+def test_digit_ids_are_the_digits(local_model):
+    tokenizer, _ = llm_client.load_local_model(local_model)
+    ids = llm_client.local_digit_ids(tokenizer)
+    assert tokenizer.convert_ids_to_tokens(ids) == list(llm_client.VALID_SCORES)
+
+
+def test_prompts_differ_in_length(local_model):
+    tokenizer, _ = llm_client.load_local_model(local_model)
+    lengths = {len(tokenizer(llm_client.local_prompt(tokenizer, q))["input_ids"]) for _, q in STATEMENTS}
+    assert len(lengths) == len(STATEMENTS)
+
+
+def test_batched_equals_unbatched(local_model):
+    contents = [q for _, q in STATEMENTS]
+    batched = llm_client.score_local(contents, local_model, batch_size=len(contents))
+    single = np.vstack([llm_client.score_local([q], local_model, batch_size=1) for q in contents])
+    assert batched.shape == (len(contents), len(llm_client.VALID_SCORES))
+    np.testing.assert_allclose(batched, single, atol=1e-5)
+    # log-probabilities over the whole vocabulary
+    assert (np.exp(batched).sum(axis=1) <= 1 + 1e-6).all()
+
+
+def test_rows_follow_the_row_contract(local_model):
+    plan = {1: 2, 3: 7}
+    rows = llm_client.get_response_local(STATEMENTS, 4, local_model, plan=plan, seed=0)
+
+    assert len(rows) == sum(plan.get(i, 4) for i, _ in STATEMENTS)
+    statements = dict(STATEMENTS)
+    for i, q, j, score in rows:
+        assert statements[i] == q
+        assert score in llm_client.VALID_SCORES
+    for i, _ in STATEMENTS:
+        assert [j for k, _, j, _ in rows if k == i] == list(range(plan.get(i, 4)))
+
+    # reproducible with a seed, the most likely answer at temperature 0
+    assert rows == llm_client.get_response_local(STATEMENTS, 4, local_model, plan=plan, seed=0)
+    best = np.argmax(llm_client.score_local([q for _, q in STATEMENTS], local_model), axis=1)
+    greedy = llm_client.get_response_local(STATEMENTS, 3, local_model, temperature=0)
+    for i, _, _, score in greedy:
+        assert score == llm_client.VALID_SCORES[best[i - 1]]
+
+
+def test_batch_size_sets_forward_passes(local_model, monkeypatch):
+    calls, handle = count_forward_passes(local_model)
+    try:
+        for batch_size, passes in ((2, 3), (5, 1), (1, 5)):
+            monkeypatch.setattr(llm_client, "LOCAL_BATCH_SIZE", batch_size)
+            calls.clear()
+            llm_client.usage.reset()
+            llm_client.get_response_local(STATEMENTS, 3, local_model, seed=0)
+            assert len(calls) == passes
+            assert llm_client.usage.snapshot()["requests"] == passes
+            # sampled answers are not generated tokens
+            assert llm_client.usage.snapshot()["output_tokens"] == 0
+    finally:
+        handle.remove()
+
+
+def test_local_threads_apply_to_registered_models(local_model, monkeypatch):
+    threads = torch.get_num_threads()
+    monkeypatch.setattr(llm_client, "LOCAL_THREADS", 1)
+    try:
+        llm_client.score_local(["rate"], local_model)
+        assert torch.get_num_threads() == 1
+    finally:
+        torch.set_num_threads(threads)
@@ -0,0 +1,53 @@
+"""
+Streaming mode "collect" (llm_client.get_response_stream) at full scale against the stand-in server.
+
+Run from the repository root:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+# llm_client creates its API clients at import time, the gpt client is replaced by one of the stand-in server
+for key in ("OPENAI_API_KEY_HfP", "ANTHROPIC_API_KEY", "TOGETHER_AI_API_KEY", "GEMINI_API_KEY", "XAI_API_KEY"):
+    os.environ.setdefault(key, "test")
+
+from openai import OpenAI  # noqa: E402
+
+import llm_client  # noqa: E402
+import main  # noqa: E402
+import stub_server  # noqa: E402
+from executor_helper import MAX_IN_FLIGHT  # noqa: E402
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # the reasoning after the score streams for 0.5 s, five times as long as the score itself
+    server = stub_server.serve(port=0, state=stub_server.StubState(seed=0, token_latency=0.1, reasoning_tokens=5))
+    port = server.server_address[1]
+    monkeypatch.setattr(llm_client, "client_gpt", OpenAI(api_key="test", base_url=f"http://127.0.0.1:{port}/v1"))
+    monkeypatch.chdir(ROOT)
+    yield
+    server.shutdown()
+
+
+def test_collect_keeps_readers_within_the_window(stub, monkeypatch):
+    monkeypatch.setattr(main, "DEADLINE", None)
+    monkeypatch.setattr(main, "HEDGE_BUDGET", 0)
+    llm_client.reasoning.drain()
+
+    rows = main.evaluate_CES("gpt", "gpt-4o-mini", stream="collect")
+    peak = llm_client.reasoning.peak
+    kept = main.match_reasoning(llm_client.reasoning.drain(), rows)
+
+    assert len(rows) == len(main.load_questionnaire(main.PATH_TO_QUESTIONS).ids) * main.NUM_ITR
+    # open streams count against the submission window instead of queueing behind it
+    assert 0 < peak <= MAX_IN_FLIGHT
+    # every kept score has its complete reasoning
+    assert len(kept) == len(rows)
+    assert {(row[0], row[1]) for row in kept} == {(row[0], row[2]) for row in rows}
+    assert all(row[4] == 1 and row[3] for row in kept)
+    assert llm_client.usage.snapshot()["requests"] == len(rows)